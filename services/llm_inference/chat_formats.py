@@ -4,6 +4,7 @@ Provides automatic detection of chat formats based on model names and manual ove
 """
 
 import os
+import re
 from abc import ABC, abstractmethod
 
 
@@ -12,6 +13,11 @@ class ChatFormat(ABC):
 
     def __init__(self, name: str):
         self.name = name
+        # Single alternation over all stop sequences, compiled once per format,
+        # so cleaning is one scan instead of one str.replace pass per sequence
+        self._stop_pattern = re.compile(
+            "|".join(map(re.escape, self.get_stop_sequences()))
+        )
 
     @abstractmethod
     def get_stop_sequences(self) -> list:
@@ -23,6 +29,10 @@ class ChatFormat(ABC):
         """Clean the model response for this format."""
         pass
 
+    def strip_stop_sequences(self, response: str) -> str:
+        """Remove every occurrence of this format's stop sequences."""
+        return self._stop_pattern.sub("", response)
+
 
 class MistralChatFormat(ChatFormat):
     """Chat format for Mistral models."""
@@ -39,8 +49,7 @@ class MistralChatFormat(ChatFormat):
         response = response.strip()
 
         # Remove stop sequences that might appear
-        for stop in self.get_stop_sequences():
-            response = response.replace(stop, "")
+        response = self.strip_stop_sequences(response)
 
         return response.strip()
 
@@ -59,8 +68,7 @@ class GemmaChatFormat(ChatFormat):
         response = response.strip()
 
         # Remove stop sequences
-        for stop in self.get_stop_sequences():
-            response = response.replace(stop, "")
+        response = self.strip_stop_sequences(response)
 
         # Remove model/user prefixes that might appear
         if response.startswith("model\n"):
@@ -83,8 +91,7 @@ class QwenChatFormat(ChatFormat):
         response = response.strip()
 
         # Remove stop sequences
-        for stop in self.get_stop_sequences():
-            response = response.replace(stop, "")
+        response = self.strip_stop_sequences(response)
 
         return response.strip()
 
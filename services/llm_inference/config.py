@@ -12,6 +12,8 @@ MODEL_FILENAME = os.path.basename(MODEL_PATH)
 
 N_CTX = int(os.getenv("LLM_N_CTX", 8192))  # Context window size
 N_GPU_LAYERS = int(os.getenv("LLM_N_GPU_LAYERS", -1))  # Offload all layers to GPU
+# When N_GPU_LAYERS is -1, probe free VRAM at startup and offload only as many layers as fit
+AUTO_GPU_LAYERS = os.getenv("LLM_AUTO_GPU_LAYERS", "true").lower() == "true"
 N_THREADS = int(os.getenv("LLM_N_THREADS", 32))
 N_BATCH = int(os.getenv("LLM_N_BATCH", N_CTX))  # Match N_CTX for optimal GPU utilization
 USE_MMAP = os.getenv("LLM_USE_MMAP", "true").lower() == "true"
@@ -68,6 +70,15 @@ DEFAULT_REPEAT_PENALTY = float(os.getenv("LLM_DEFAULT_REPEAT_PENALTY", 1.0))
 # Stop sequences are automatically determined by the chat format
 STOP_SEQUENCES = _chat_format.get_stop_sequences()
 
+# --- Prompt (KV prefix) Cache Configuration ---
+# Keeps llama.cpp KV state for recently evaluated prompts in RAM so a new prompt
+# sharing a long prefix (e.g. the same system prompt) skips prefill for that prefix.
+# Off by default: llama-cpp-python saves the full KV state to the cache after every
+# completion (streaming included), which adds a host copy to each request and uses up
+# to PROMPT_CACHE_CAPACITY_MB of RAM. Enable it when prompts share long prefixes.
+PROMPT_CACHE_ENABLED = os.getenv("LLM_PROMPT_CACHE_ENABLED", "false").lower() == "true"
+PROMPT_CACHE_CAPACITY_MB = int(os.getenv("LLM_PROMPT_CACHE_CAPACITY_MB", 2048))
+
 # --- Model Warmup Configuration ---
 # Perform a warmup prompt to ensure model is fully ready
 ENABLE_WARMUP = os.getenv("LLM_ENABLE_WARMUP", "true").lower() == "true"
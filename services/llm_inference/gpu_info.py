@@ -0,0 +1,181 @@
+"""
+GPU introspection helpers for the LLM inference service.
+Queries nvidia-smi so no extra Python bindings are required.
+"""
+
+import logging
+import os
+import struct
+import subprocess
+from typing import BinaryIO, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Flash attention kernels in llama.cpp are only a win on Ampere (sm_80) and newer
+FLASH_ATTN_MIN_COMPUTE_CAPABILITY = (8, 0)
+
+# Fraction of free VRAM that layer weights may use; the rest is left for KV cache and scratch
+GPU_LAYER_VRAM_FRACTION = 0.9
+
+# GGUF metadata value types -> struct format (fixed-size scalars only)
+_GGUF_SCALAR_FORMATS = {
+    0: "<B", 1: "<b", 2: "<H", 3: "<h", 4: "<I", 5: "<i",
+    6: "<f", 7: "<?", 10: "<Q", 11: "<q", 12: "<d",
+}
+_GGUF_TYPE_STRING = 8
+_GGUF_TYPE_ARRAY = 9
+
+
+def get_cuda_compute_capability() -> Optional[Tuple[int, int]]:
+    """
+    Get the CUDA compute capability of the first GPU.
+
+    Returns:
+        (major, minor) tuple, or None if no GPU or nvidia-smi is unavailable
+    """
+    try:
+        result = subprocess.run([
+            "nvidia-smi", "--query-gpu=compute_cap",
+            "--format=csv,noheader,nounits"
+        ], capture_output=True, text=True, timeout=10)
+
+        if result.returncode == 0:
+            lines = result.stdout.strip().splitlines()
+            if lines:
+                # Use the first GPU, matching the device llama.cpp offloads to
+                major, minor = lines[0].strip().split(".")
+                return int(major), int(minor)
+    except (subprocess.TimeoutExpired, FileNotFoundError, ValueError) as e:
+        logger.warning(f"Could not get GPU compute capability: {e}")
+
+    return None
+
+
+def check_flash_attn_support(flash_attn: bool) -> None:
+    """Warn when flash attention is enabled on a GPU older than Ampere."""
+    if not flash_attn:
+        return
+
+    capability = get_cuda_compute_capability()
+    if capability is not None and capability < FLASH_ATTN_MIN_COMPUTE_CAPABILITY:
+        logger.warning(
+            f"LLM_FLASH_ATTN is enabled but the GPU has compute capability "
+            f"{capability[0]}.{capability[1]} (pre-Ampere); flash attention may be "
+            f"slower than the default path here. Set LLM_FLASH_ATTN=false if you "
+            f"see degraded throughput."
+        )
+
+
+def get_free_vram_bytes() -> Optional[int]:
+    """
+    Get free memory on the first GPU.
+
+    Returns:
+        Free VRAM in bytes, or None if no GPU or nvidia-smi is unavailable
+    """
+    try:
+        result = subprocess.run([
+            "nvidia-smi", "--query-gpu=memory.free",
+            "--format=csv,noheader,nounits"
+        ], capture_output=True, text=True, timeout=10)
+
+        if result.returncode == 0:
+            lines = result.stdout.strip().splitlines()
+            if lines:
+                return int(lines[0].strip()) * 1024 * 1024
+    except (subprocess.TimeoutExpired, FileNotFoundError, ValueError) as e:
+        logger.warning(f"Could not get free GPU memory: {e}")
+
+    return None
+
+
+def _read_gguf_string(f: BinaryIO) -> str:
+    (length,) = struct.unpack("<Q", f.read(8))
+    return f.read(length).decode("utf-8", errors="replace")
+
+
+def _read_gguf_value(f: BinaryIO, value_type: int):
+    if value_type == _GGUF_TYPE_STRING:
+        return _read_gguf_string(f)
+    if value_type == _GGUF_TYPE_ARRAY:
+        item_type, count = struct.unpack("<IQ", f.read(12))
+        if item_type in _GGUF_SCALAR_FORMATS:
+            # Skip fixed-size arrays (e.g. token scores) without decoding them
+            f.seek(struct.calcsize(_GGUF_SCALAR_FORMATS[item_type]) * count, os.SEEK_CUR)
+        else:
+            for _ in range(count):
+                _read_gguf_value(f, item_type)
+        return None
+    fmt = _GGUF_SCALAR_FORMATS[value_type]
+    (value,) = struct.unpack(fmt, f.read(struct.calcsize(fmt)))
+    return value
+
+
+def get_gguf_layer_count(model_path: str) -> Optional[int]:
+    """
+    Read the transformer block count from a GGUF file's metadata.
+
+    Args:
+        model_path: Path to the GGUF model file
+
+    Returns:
+        Number of layers (``<arch>.block_count``), or None if it can't be read
+    """
+    try:
+        with open(model_path, "rb") as f:
+            if f.read(4) != b"GGUF":
+                return None
+            _version, _tensor_count, kv_count = struct.unpack("<IQQ", f.read(20))
+            for _ in range(kv_count):
+                key = _read_gguf_string(f)
+                (value_type,) = struct.unpack("<I", f.read(4))
+                value = _read_gguf_value(f, value_type)
+                if key.endswith(".block_count"):
+                    return int(value)
+    except (OSError, struct.error, KeyError, ValueError) as e:
+        logger.warning(f"Could not read layer count from {model_path}: {e}")
+
+    return None
+
+
+def resolve_n_gpu_layers(model_path: str, requested: int) -> int:
+    """
+    Pick how many layers to offload based on the model size and free VRAM.
+
+    Only applies when ``requested`` is -1 (offload everything); an explicit
+    layer count is respected as-is. Falls back to ``requested`` when the GPU
+    or model metadata can't be inspected.
+
+    Args:
+        model_path: Path to the GGUF model file
+        requested: Configured n_gpu_layers value
+
+    Returns:
+        n_gpu_layers to pass to llama.cpp (-1 when the whole model fits)
+    """
+    if requested != -1:
+        logger.info(f"Using configured n_gpu_layers={requested}")
+        return requested
+
+    free_bytes = get_free_vram_bytes()
+    n_layers = get_gguf_layer_count(model_path)
+    if free_bytes is None or not n_layers:
+        logger.info(f"Could not probe VRAM/model layers, using n_gpu_layers={requested}")
+        return requested
+
+    model_bytes = os.path.getsize(model_path)
+    budget = free_bytes * GPU_LAYER_VRAM_FRACTION
+    if model_bytes <= budget:
+        logger.info(
+            f"Model ({model_bytes / 1024**3:.1f} GB, {n_layers} layers) fits in "
+            f"{free_bytes / 1024**3:.1f} GB free VRAM - offloading all layers (n_gpu_layers=-1)"
+        )
+        return -1
+
+    per_layer_bytes = model_bytes / n_layers
+    n_gpu_layers = min(n_layers, int(budget // per_layer_bytes))
+    logger.info(
+        f"Model ({model_bytes / 1024**3:.1f} GB) exceeds free VRAM "
+        f"({free_bytes / 1024**3:.1f} GB) - offloading {n_gpu_layers}/{n_layers} layers"
+    )
+    return n_gpu_layers
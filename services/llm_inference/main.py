@@ -1,16 +1,22 @@
 # services/llm_inference/main.py
+import asyncio
 import logging
 import hashlib
+import struct
+import threading
 import time
 from functools import lru_cache
 from fastapi import FastAPI, HTTPException
+from fastapi.responses import ORJSONResponse
 from pydantic import BaseModel, Field
 from typing import List, Optional
-from llama_cpp import Llama
-from starlette.responses import StreamingResponse
+from llama_cpp import Llama, LlamaRAMCache
+import orjson
+from starlette.responses import Response, StreamingResponse
 
 # Import configurations from the config file
 import config
+import gpu_info
 
 # --- Logging Setup ---
 logging.basicConfig(level=logging.INFO)
@@ -18,24 +24,35 @@ logger = logging.getLogger(__name__)
 
 
 # --- Pydantic Models for API ---
+# Integer parameters are packed as int64 into response cache keys
+INT64_MIN = -2**63
+INT64_MAX = 2**63 - 1
+
+
 # This defines the contract for the /generate endpoint
 class GenerationRequest(BaseModel):
     prompt: str
-    max_tokens: int = Field(default=config.DEFAULT_MAX_TOKENS)
+    max_tokens: int = Field(default=config.DEFAULT_MAX_TOKENS, ge=INT64_MIN, le=INT64_MAX)
     temperature: float = Field(default=config.DEFAULT_TEMP)
     top_p: float = Field(default=config.DEFAULT_TOP_P)
-    top_k: int = Field(default=config.DEFAULT_TOP_K)
+    top_k: int = Field(default=config.DEFAULT_TOP_K, ge=INT64_MIN, le=INT64_MAX)
     repeat_penalty: float = Field(default=config.DEFAULT_REPEAT_PENALTY)
     stop: Optional[List[str]] = Field(default=config.STOP_SEQUENCES)
     stream: bool = Field(default=False)
 
 
 # --- FastAPI App and Model Loading ---
-app = FastAPI(title="LLM Inference Service")
+app = FastAPI(title="LLM Inference Service", default_response_class=ORJSONResponse)
 
 
 def load_model():
     """Loads the Llama model with a fallback for memory locking issues."""
+    gpu_info.check_flash_attn_support(config.FLASH_ATTN)
+
+    n_gpu_layers = config.N_GPU_LAYERS
+    if config.AUTO_GPU_LAYERS:
+        n_gpu_layers = gpu_info.resolve_n_gpu_layers(config.MODEL_PATH, n_gpu_layers)
+
     try:
         logger.info(
             f"Attempting to load LLM model from: {config.MODEL_PATH} with mlock..."
@@ -43,7 +60,7 @@ def load_model():
         llm = Llama(
             model_path=config.MODEL_PATH,
             n_ctx=config.N_CTX,
-            n_gpu_layers=config.N_GPU_LAYERS,
+            n_gpu_layers=n_gpu_layers,
             n_threads=config.N_THREADS,
             n_batch=config.N_BATCH,
             use_mmap=config.USE_MMAP,
@@ -60,7 +77,7 @@ def load_model():
             llm = Llama(
                 model_path=config.MODEL_PATH,
                 n_ctx=config.N_CTX,
-                n_gpu_layers=config.N_GPU_LAYERS,
+                n_gpu_layers=n_gpu_layers,
                 n_threads=config.N_THREADS,
                 n_batch=config.N_BATCH,
                 use_mmap=config.USE_MMAP,
@@ -76,6 +93,16 @@ def load_model():
             raise
 
 
+def enable_prompt_cache(llm_instance):
+    """Attach an in-memory KV state cache so shared prompt prefixes skip prefill."""
+    if not config.PROMPT_CACHE_ENABLED:
+        return
+
+    capacity_bytes = config.PROMPT_CACHE_CAPACITY_MB * 1024 * 1024
+    llm_instance.set_cache(LlamaRAMCache(capacity_bytes=capacity_bytes))
+    logger.info(f"Prompt prefix cache enabled ({config.PROMPT_CACHE_CAPACITY_MB} MB)")
+
+
 def warmup_model(llm_instance):
     """Perform a warmup prompt to ensure the model is fully ready."""
     if not config.ENABLE_WARMUP:
@@ -104,29 +131,69 @@ def warmup_model(llm_instance):
 
 
 llm = load_model()
+enable_prompt_cache(llm)
 
-# Log the detected chat format
+# Resolve the chat format once; reused by request handlers and health checks
 chat_format = config.get_chat_format()
 logger.info(
     f"Using chat format: {chat_format.name} for model: {config.MODEL_FILENAME}"
 )
-logger.info(f"Stop sequences: {chat_format.get_stop_sequences()}")
+logger.info(f"Stop sequences: {config.STOP_SEQUENCES}")
 
 # Warmup the model to ensure it's fully ready
 warmup_model(llm)
 
 # --- Response Cache ---
-# Simple cache for non-streaming responses to avoid recomputation
+# Simple cache for non-streaming responses to avoid recomputation.
+# Values are orjson-serialized bodies so hits skip JSON encoding entirely.
 response_cache = {}
 
+# Fixed-layout packing of the generation parameters for cache keys: prompt byte length,
+# max_tokens, temperature, top_p, top_k, repeat_penalty, number of stop sequences
+_CACHE_KEY_PARAMS = struct.Struct("<Qqddqdi")
+_CACHE_KEY_STOP_LEN = struct.Struct("<I")
+
+# Non-streaming generations currently running, keyed like response_cache, so
+# identical concurrent requests share one LLM call ("singleflight")
+inflight_requests = {}
+
+# A llama.cpp context is not thread-safe; serialize generation calls. Both the
+# non-streaming calls (run via asyncio.to_thread) and streaming generators (iterated
+# in Starlette's threadpool) run in worker threads, so this is a threading lock.
+llm_lock = threading.Lock()
+
+
+def run_llm(**kwargs):
+    """Run a blocking, non-streaming generation while holding llm_lock."""
+    with llm_lock:
+        return llm(**kwargs)
+
 
 def get_cache_key(request: GenerationRequest) -> str:
     """Generate a cache key for the request (only for non-streaming)."""
     if request.stream:
         return None
 
-    cache_data = f"{request.prompt}|{request.max_tokens}|{request.temperature}|{request.top_p}|{request.top_k}|{request.repeat_penalty}|{request.stop}"
-    return hashlib.md5(cache_data.encode()).hexdigest()
+    # Hash the prompt bytes and a packed parameter block directly,
+    # without building an intermediate string containing the whole prompt
+    prompt = request.prompt.encode("utf-8", "surrogatepass")
+    stop = request.stop or ()
+    h = hashlib.blake2b(digest_size=16)
+    h.update(_CACHE_KEY_PARAMS.pack(
+        len(prompt),
+        request.max_tokens,
+        request.temperature,
+        request.top_p,
+        request.top_k,
+        request.repeat_penalty,
+        len(stop),
+    ))
+    h.update(prompt)
+    for s in stop:
+        encoded = s.encode("utf-8", "surrogatepass")
+        h.update(_CACHE_KEY_STOP_LEN.pack(len(encoded)))
+        h.update(encoded)
+    return h.hexdigest()
 
 
 # --- API Endpoint ---
@@ -142,12 +209,45 @@ async def generate(request: GenerationRequest):
             cache_key = get_cache_key(request)
             if cache_key and cache_key in response_cache:
                 logger.info("Cache hit - returning cached response")
-                return response_cache[cache_key]
+                # Cached entries are already-serialized JSON bodies
+                return Response(content=response_cache[cache_key], media_type="application/json")
 
         if request.stream:
             # For streaming responses, we return a StreamingResponse that yields tokens.
+            # The lock is held for the whole stream, since every token is decoded in the shared context.
             def stream_generator():
-                streamer = llm(
+                with llm_lock:
+                    streamer = llm(
+                        prompt=request.prompt,
+                        max_tokens=request.max_tokens,
+                        temperature=request.temperature,
+                        top_p=request.top_p,
+                        top_k=request.top_k,
+                        repeat_penalty=request.repeat_penalty,
+                        stop=request.stop,
+                        stream=True,
+                    )
+                    for chunk in streamer:
+                        if "choices" in chunk and len(chunk["choices"]) > 0:
+                            token = chunk["choices"][0].get("text", "")
+                            yield token
+
+            return StreamingResponse(stream_generator(), media_type="text/plain")
+
+        else:
+            # Identical request already generating: wait for its result instead of rerunning the LLM
+            if cache_key in inflight_requests:
+                logger.info("Identical request in flight - awaiting its response")
+                response_body = await asyncio.shield(inflight_requests[cache_key])
+                return Response(content=response_body, media_type="application/json")
+
+            future = asyncio.get_running_loop().create_future()
+            inflight_requests[cache_key] = future
+            try:
+                # For non-streaming, run the blocking call off the event loop so
+                # duplicate requests can arrive and join the in-flight future.
+                result = await asyncio.to_thread(
+                    run_llm,
                     prompt=request.prompt,
                     max_tokens=request.max_tokens,
                     temperature=request.temperature,
@@ -155,39 +255,32 @@ async def generate(request: GenerationRequest):
                     top_k=request.top_k,
                     repeat_penalty=request.repeat_penalty,
                     stop=request.stop,
-                    stream=True,
                 )
-                for chunk in streamer:
-                    if "choices" in chunk and len(chunk["choices"]) > 0:
-                        token = chunk["choices"][0].get("text", "")
-                        yield token
-
-            return StreamingResponse(stream_generator(), media_type="text/plain")
-
-        else:
-            # For non-streaming, we make a blocking call and return the full response.
-            result = llm(
-                prompt=request.prompt,
-                max_tokens=request.max_tokens,
-                temperature=request.temperature,
-                top_p=request.top_p,
-                top_k=request.top_k,
-                repeat_penalty=request.repeat_penalty,
-                stop=request.stop,
-            )
-            response_text = result["choices"][0]["text"]
-
-            # Clean the response using the chat format's cleaning method
-            cleaned_response = chat_format.clean_response(response_text)
-            response_obj = {"response": cleaned_response}
-
-            # Cache the response for future requests (with simple size limit)
-            cache_key = get_cache_key(request)
-            if cache_key and len(response_cache) < 1000:  # Simple cache size limit
-                response_cache[cache_key] = response_obj
-                logger.info("Response cached")
-
-            return response_obj
+                response_text = result["choices"][0]["text"]
+
+                # Clean the response using the chat format's cleaning method
+                cleaned_response = chat_format.clean_response(response_text)
+                response_body = orjson.dumps({"response": cleaned_response})
+
+                # Cache the serialized response for future requests (with simple size limit)
+                if len(response_cache) < 1000:  # Simple cache size limit
+                    response_cache[cache_key] = response_body
+                    logger.info("Response cached")
+
+                future.set_result(response_body)
+                return Response(content=response_body, media_type="application/json")
+            except Exception as e:
+                future.set_exception(e)
+                # Mark the exception as retrieved so asyncio doesn't log it when nobody else was waiting
+                future.exception()
+                raise
+            finally:
+                # A cancelled request (client disconnect, timeout) skips the except above;
+                # fail the future so identical requests waiting on it don't hang
+                if not future.done():
+                    future.set_exception(RuntimeError("Generation was cancelled"))
+                    future.exception()
+                del inflight_requests[cache_key]
 
     except Exception as e:
         logger.error(f"Error during LLM model generation: {e}", exc_info=True)
@@ -199,7 +292,6 @@ async def generate(request: GenerationRequest):
 @app.get("/health")
 def health_check():
     """A simple endpoint to check if the LLM service is running."""
-    chat_format = config.get_chat_format()
     return {
         "status": "ok",
         "model_loaded": config.MODEL_FILENAME,
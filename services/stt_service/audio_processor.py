@@ -2,20 +2,40 @@
 Audio Processing Utilities for STT Service
 """
 
+import functools
 import io
 import logging
+import math
 import subprocess
 import tempfile
 from pathlib import Path
-from typing import Optional, Union
+from typing import BinaryIO, Optional, Union
 
 import numpy as np
 import soundfile as sf
+from numpy.lib.stride_tricks import sliding_window_view
+from scipy import signal
 
 import config
 
 logger = logging.getLogger(__name__)
 
+# Formats decoded through ffmpeg rather than soundfile
+FFMPEG_FORMATS = ('.webm', '.mp4', '.m4a', '.ogg')
+# Containers that may keep their index at the end of the file (MP4 moov atom)
+# and therefore can't be demuxed from a non-seekable stdin pipe
+FFMPEG_SEEKABLE_FORMATS = ('.mp4', '.m4a')
+# Largest reduced up/down factor resampled with a polyphase filter; odd rates
+# (e.g. 44101 Hz) would otherwise need a filter with hundreds of thousands of taps
+MAX_POLYPHASE_FACTOR = 1000
+
+
+@functools.lru_cache(maxsize=8)
+def _resample_filter(up: int, down: int) -> np.ndarray:
+    """Anti-aliasing FIR for resample_poly, designed as its default but built once per rate pair"""
+    max_rate = max(up, down)
+    return signal.firwin(2 * 10 * max_rate + 1, 1.0 / max_rate, window=('kaiser', 5.0))
+
 
 class AudioProcessor:
     """Handles audio format conversion and validation"""
@@ -33,39 +53,152 @@ class AudioProcessor:
         return file_ext in config.SUPPORTED_FORMATS
 
     @staticmethod
-    def convert_with_ffmpeg(input_path: str, output_path: str) -> bool:
+    def downmix_to_mono(audio: np.ndarray) -> np.ndarray:
+        """
+        Average all channels of a (samples, channels) array into one channel
+
+        Sums into a preallocated contiguous float32 buffer and scales in place,
+        avoiding the intermediate allocation of ``audio.mean(axis=1)``.
+
+        Args:
+            audio: 2D numpy array of shape (samples, channels)
+
+        Returns:
+            Contiguous 1D float32 array of mono samples
+        """
+        num_channels = audio.shape[1]
+        if num_channels == 1:
+            return np.ascontiguousarray(audio[:, 0], dtype=np.float32)
+
+        out = np.empty(audio.shape[0], dtype=np.float32)
+        if num_channels == 2:
+            np.add(audio[:, 0], audio[:, 1], out=out)
+        else:
+            np.einsum("ij->i", audio, out=out)
+        out *= np.float32(1.0 / num_channels)
+        return out
+
+    @staticmethod
+    def resample_to_target(audio: np.ndarray, sample_rate: int) -> np.ndarray:
+        """
+        Resample mono audio to config.TARGET_SAMPLE_RATE
+
+        Uses a polyphase filter (scipy.signal.resample_poly) for the reduced
+        integer ratio between the rates, e.g. 160/441 for 44.1kHz.
+
+        Args:
+            audio: 1D numpy array of mono samples
+            sample_rate: Sample rate of the input
+
+        Returns:
+            float32 numpy array at the target sample rate
+        """
+        target_rate = config.TARGET_SAMPLE_RATE
+        if sample_rate == target_rate or len(audio) == 0:
+            return audio
+
+        divisor = math.gcd(sample_rate, target_rate)
+        up, down = target_rate // divisor, sample_rate // divisor
+        if max(up, down) > MAX_POLYPHASE_FACTOR:
+            logger.warning(f"Unusual sample rate {sample_rate}Hz, resampling with linear interpolation")
+            positions = np.arange(round(len(audio) * target_rate / sample_rate)) * (sample_rate / target_rate)
+            return np.interp(positions, np.arange(len(audio)), audio).astype(np.float32)
+
+        resampled = signal.resample_poly(audio, up, down, window=_resample_filter(up, down), padtype='line')
+        return resampled.astype(np.float32, copy=False)
+
+    @staticmethod
+    def stage_temp_file(data: bytes, suffix: str) -> str:
         """
-        Convert audio to WAV using ffmpeg
+        Write data to a temp file under config.TEMP_DIR
+
+        TEMP_DIR defaults to tmpfs, which may be much smaller than the upload
+        limit (e.g. Docker's 64 MB /dev/shm); if the write fails there, the
+        file is staged in the system temp directory instead.
+
+        Args:
+            data: Bytes to write
+            suffix: File name suffix (e.g. ".mp4")
+
+        Returns:
+            Path of the temp file; the caller deletes it
+        """
+        tmp_path = None
+        try:
+            with tempfile.NamedTemporaryFile(suffix=suffix, dir=config.TEMP_DIR, delete=False) as tmp:
+                tmp_path = tmp.name
+                tmp.write(data)
+            return tmp_path
+        except OSError as e:
+            if tmp_path:
+                Path(tmp_path).unlink(missing_ok=True)
+            logger.warning(f"Could not stage upload in {config.TEMP_DIR} ({e}), using {tempfile.gettempdir()}")
+
+        with tempfile.NamedTemporaryFile(suffix=suffix, delete=False) as tmp:
+            tmp.write(data)
+            return tmp.name
+
+    @staticmethod
+    def convert_with_ffmpeg(audio_bytes: bytes, file_ext: str) -> Optional[np.ndarray]:
+        """
+        Decode audio to 16kHz mono float32 PCM using ffmpeg
+
+        Input is fed through stdin and raw PCM is read back from stdout, so no
+        intermediate WAV is written. Containers that need a seekable input
+        (see FFMPEG_SEEKABLE_FORMATS) are staged in a temp file under
+        config.TEMP_DIR instead (see stage_temp_file).
 
         Args:
-            input_path: Path to input audio file
-            output_path: Path to output WAV file
+            audio_bytes: Encoded audio file bytes
+            file_ext: Lowercase file extension (e.g. ".webm")
 
         Returns:
-            True if conversion succeeded, False otherwise
+            Numpy array of audio samples, or None if conversion failed
         """
+        tmp_path = None
         try:
-            # ffmpeg command: convert to 16kHz mono WAV
+            if file_ext in FFMPEG_SEEKABLE_FORMATS:
+                tmp_path = AudioProcessor.stage_temp_file(audio_bytes, file_ext)
+                input_arg, stdin_data = tmp_path, None
+            else:
+                input_arg, stdin_data = 'pipe:0', audio_bytes
+
+            # ffmpeg command: decode to 16kHz mono 32-bit float PCM on stdout
             cmd = [
-                'ffmpeg', '-i', input_path,
-                '-ar', '16000',  # 16kHz sample rate (Whisper native)
+                'ffmpeg',
+                '-threads', '0',
+                '-i', input_arg,
+                '-ar', str(config.TARGET_SAMPLE_RATE),  # 16kHz sample rate (Whisper native)
                 '-ac', '1',       # Mono
-                '-y',             # Overwrite output
+                '-f', 'f32le',    # Raw little-endian float32, no container
                 '-loglevel', 'error',  # Only show errors
-                output_path
+                'pipe:1'
             ]
-            result = subprocess.run(cmd, capture_output=True, text=True, timeout=30)
+            if stdin_data is None:
+                # Reading from a file: keep ffmpeg from waiting on stdin
+                cmd.insert(1, '-nostdin')
+                result = subprocess.run(
+                    cmd, stdin=subprocess.DEVNULL, stdout=subprocess.PIPE, stderr=subprocess.PIPE, timeout=30
+                )
+            else:
+                result = subprocess.run(
+                    cmd, input=stdin_data, stdout=subprocess.PIPE, stderr=subprocess.PIPE, timeout=30
+                )
             if result.returncode != 0:
-                logger.error(f"ffmpeg conversion failed: {result.stderr}")
-                return False
-            logger.info(f"Successfully converted {Path(input_path).suffix} to WAV")
-            return True
+                stderr = result.stderr.decode('utf-8', errors='replace')
+                logger.error(f"ffmpeg conversion failed: {stderr}")
+                return None
+            logger.info(f"Successfully decoded {file_ext} with ffmpeg")
+            return np.frombuffer(result.stdout, dtype='<f4')
         except subprocess.TimeoutExpired:
             logger.error("ffmpeg conversion timeout (>30s)")
-            return False
+            return None
         except Exception as e:
             logger.error(f"ffmpeg conversion error: {e}")
-            return False
+            return None
+        finally:
+            if tmp_path:
+                Path(tmp_path).unlink(missing_ok=True)
 
     @staticmethod
     def load_audio_from_bytes(
@@ -83,48 +216,91 @@ class AudioProcessor:
             Numpy array of audio samples (float32, mono, 16kHz)
         """
         try:
-            # Save to temporary file
-            with tempfile.NamedTemporaryFile(suffix=Path(filename).suffix, delete=False) as tmp:
-                tmp.write(audio_bytes)
-                tmp_path = tmp.name
+            # Check if format needs ffmpeg conversion
+            file_ext = Path(filename).suffix.lower()
+
+            if file_ext in FFMPEG_FORMATS:
+                logger.info(f"Decoding {file_ext} using ffmpeg...")
+                audio = AudioProcessor.convert_with_ffmpeg(audio_bytes, file_ext)
+                if audio is None:
+                    raise ValueError(f"Failed to decode {file_ext} audio")
+                sample_rate = config.TARGET_SAMPLE_RATE
+            else:
+                # Save to temporary file (on tmpfs by default, see config.TEMP_DIR)
+                with tempfile.NamedTemporaryFile(suffix=Path(filename).suffix, dir=config.TEMP_DIR, delete=False) as tmp:
+                    tmp.write(audio_bytes)
+                    tmp_path = tmp.name
+
+                try:
+                    # Load directly with soundfile
+                    audio, sample_rate = sf.read(tmp_path, dtype='float32')
+                finally:
+                    # Clean up temp file
+                    Path(tmp_path).unlink(missing_ok=True)
 
-            wav_path = None  # Track converted file for cleanup
+            # Convert to mono if stereo
+            if len(audio.shape) > 1:
+                audio = AudioProcessor.downmix_to_mono(audio)
 
-            try:
-                # Check if format needs ffmpeg conversion
-                file_ext = Path(filename).suffix.lower()
-                formats_needing_conversion = ['.webm', '.mp4', '.m4a', '.ogg']
+            logger.info(f"Loaded audio: {len(audio)/sample_rate:.2f}s at {sample_rate}Hz")
 
-                if file_ext in formats_needing_conversion:
-                    logger.info(f"Converting {file_ext} to WAV using ffmpeg...")
-                    # Create temp WAV file
-                    wav_path = tmp_path.replace(file_ext, '.wav')
+            return AudioProcessor.resample_to_target(audio, sample_rate)
 
-                    if not AudioProcessor.convert_with_ffmpeg(tmp_path, wav_path):
-                        raise ValueError(f"Failed to convert {file_ext} to WAV")
+        except Exception as e:
+            logger.error(f"Failed to load audio from bytes: {e}")
+            raise ValueError(f"Invalid audio file: {e}")
 
-                    # Load converted WAV
-                    audio, sample_rate = sf.read(wav_path, dtype='float32')
-                else:
-                    # Load directly with soundfile
-                    audio, sample_rate = sf.read(tmp_path, dtype='float32')
+    @staticmethod
+    def load_audio_from_upload(
+        fileobj: BinaryIO,
+        filename: str = "audio.wav"
+    ) -> np.ndarray:
+        """
+        Load audio from an uploaded file object without reading it into bytes
 
-            finally:
-                # Clean up temp files
-                Path(tmp_path).unlink(missing_ok=True)
-                if wav_path:
-                    Path(wav_path).unlink(missing_ok=True)
+        Formats soundfile can read are decoded straight from the (spooled)
+        upload in blocks of config.UPLOAD_BLOCK_SECONDS, downmixing each block
+        into a single output array preallocated from the header's frame count
+        (grown if the file holds more). ffmpeg formats fall back to
+        load_audio_from_bytes.
 
-            # Convert to mono if stereo
-            if len(audio.shape) > 1:
-                audio = audio.mean(axis=1)
+        Args:
+            fileobj: Seekable binary file object (e.g. UploadFile.file)
+            filename: Original filename (for format detection)
+
+        Returns:
+            Numpy array of audio samples (float32, mono, 16kHz)
+        """
+        fileobj.seek(0)
+        file_ext = Path(filename).suffix.lower()
+        if file_ext in FFMPEG_FORMATS:
+            return AudioProcessor.load_audio_from_bytes(fileobj.read(), filename)
+
+        try:
+            with sf.SoundFile(fileobj) as sf_file:
+                sample_rate = sf_file.samplerate
+                audio = np.empty(sf_file.frames, dtype=np.float32)
+                blocksize = sample_rate * config.UPLOAD_BLOCK_SECONDS
+
+                filled = 0
+                for block in sf_file.blocks(blocksize=blocksize, dtype='float32'):
+                    if block.ndim > 1:
+                        block = AudioProcessor.downmix_to_mono(block)
+                    # Frame counts from some headers (e.g. MP3) are estimates,
+                    # so the file may hold more frames than were allocated
+                    if filled + len(block) > len(audio):
+                        audio = np.resize(audio, max(filled + len(block), 2 * len(audio)))
+                    audio[filled:filled + len(block)] = block
+                    filled += len(block)
+
+            audio = audio[:filled]
 
             logger.info(f"Loaded audio: {len(audio)/sample_rate:.2f}s at {sample_rate}Hz")
 
-            return audio
+            return AudioProcessor.resample_to_target(audio, sample_rate)
 
         except Exception as e:
-            logger.error(f"Failed to load audio from bytes: {e}")
+            logger.error(f"Failed to load audio from upload: {e}")
             raise ValueError(f"Invalid audio file: {e}")
 
     @staticmethod
@@ -136,18 +312,18 @@ class AudioProcessor:
             file_path: Path to audio file
 
         Returns:
-            Numpy array of audio samples (float32, mono)
+            Numpy array of audio samples (float32, mono, 16kHz)
         """
         try:
             audio, sample_rate = sf.read(file_path, dtype='float32')
 
             # Convert to mono if stereo
             if len(audio.shape) > 1:
-                audio = audio.mean(axis=1)
+                audio = AudioProcessor.downmix_to_mono(audio)
 
             logger.info(f"Loaded audio file: {len(audio)/sample_rate:.2f}s at {sample_rate}Hz")
 
-            return audio
+            return AudioProcessor.resample_to_target(audio, sample_rate)
 
         except Exception as e:
             logger.error(f"Failed to load audio file {file_path}: {e}")
@@ -187,17 +363,28 @@ class AudioProcessor:
             overlap: Overlap duration in seconds
 
         Returns:
-            List of audio chunks
+            List of audio chunks (views into ``audio``, not copies)
         """
         chunk_samples = int(chunk_duration * sample_rate)
         overlap_samples = int(overlap * sample_rate)
         step = chunk_samples - overlap_samples
+        num_samples = len(audio)
 
-        chunks = []
-        for i in range(0, len(audio), step):
-            chunk = audio[i:i + chunk_samples]
-            if len(chunk) > 0:  # Avoid empty chunks
-                chunks.append(chunk)
+        if step <= 0:
+            raise ValueError(
+                f"overlap ({overlap}s) must be shorter than chunk_duration ({chunk_duration}s)"
+            )
+
+        # Full-length windows as zero-copy strided views of the input
+        if num_samples >= chunk_samples:
+            windows = sliding_window_view(audio, chunk_samples)[::step]
+            chunks = list(windows)
+        else:
+            chunks = []
+
+        # Trailing partial windows (shorter than chunk_samples); with overlap there
+        # are at most ceil(chunk_samples / step) of these, independent of audio length
+        chunks.extend(audio[i:] for i in range(len(chunks) * step, num_samples, step))
 
         logger.info(f"Split audio into {len(chunks)} chunks of {chunk_duration}s")
         return chunks
@@ -210,7 +397,13 @@ class AudioProcessor:
     @staticmethod
     def normalize_audio(audio: np.ndarray) -> np.ndarray:
         """Normalize audio to [-1, 1] range"""
-        max_val = np.abs(audio).max()
+        if len(audio) == 0:
+            return audio
+
+        # Peak from max/min reductions avoids allocating a full-size abs() array,
+        # and Python ints keep int16 input from overflowing on -32768
+        max_val = max(audio.max().item(), -audio.min().item())
         if max_val > 0:
-            return audio / max_val
+            # Multiply by the reciprocal rather than dividing every sample
+            return np.multiply(audio, np.float32(1.0 / max_val), dtype=np.float32)
         return audio
@@ -3,6 +3,7 @@ Configuration for Whisper STT Service
 """
 
 import os
+import tempfile
 from pathlib import Path
 
 # Service Configuration
@@ -13,9 +14,38 @@ PORT = 8034
 
 # Model Configuration
 MODEL_NAME = "large-v3-turbo"  # Will use faster-whisper's auto-download
-MODEL_SIZE = "large-v3-turbo"
-DEVICE = "cuda"  # or "cpu"
-COMPUTE_TYPE = "float16"  # For GPU: float16, int8_float16 | For CPU: int8
+MODEL_SIZE = os.getenv("STT_MODEL_SIZE", "large-v3-turbo")
+DEVICE = os.getenv("STT_DEVICE", "cuda")  # or "cpu"
+
+# Quantized weights by default: int8_float16 (int8 weights, fp16 activations) on GPU
+# roughly halves VRAM and bytes moved per decoder step with negligible WER change
+# (~0.3% on LibriSpeech for large-v3-turbo); int8 on CPU.
+# None = pick from the GPU's compute capability at startup (see WhisperTranscriber):
+#   Ampere+ (sm_80+) -> int8_float16, Volta/Turing (sm_70-75) -> float16, older GPUs/CPU -> int8
+# Override with STT_COMPUTE_TYPE (e.g. "float16") if you have benchmarked your hardware.
+COMPUTE_TYPE = os.getenv("STT_COMPUTE_TYPE") or None
+DEFAULT_GPU_COMPUTE_TYPE = "int8_float16"  # Used when the GPU's compute capability can't be read
+
+# Flash attention for the Whisper encoder/decoder (faster-whisper >= 1.1).
+# Only applied on CUDA GPUs with compute capability >= FLASH_ATTN_MIN_COMPUTE_CAPABILITY (Ampere+).
+# Turned off again at load if the installed CTranslate2 build has no flash attention kernels.
+FLASH_ATTN = os.getenv("STT_FLASH_ATTN", "true").lower() == "true"
+FLASH_ATTN_MIN_COMPUTE_CAPABILITY = (8, 0)
+
+# Compute log-mel features on the GPU instead of NumPy on the CPU.
+# Requires torch with CUDA (optional, not installed by default); falls back to CPU otherwise.
+GPU_FEATURE_EXTRACTION = os.getenv("STT_GPU_FEATURES", "true").lower() == "true"
+
+# CTranslate2 runtime settings, exported by transcriber.py before faster-whisper is imported.
+# Values already present in the environment take precedence.
+CT2_ENV = {
+    # Keep freed CUDA blocks cached for reuse (up to 1 GiB) instead of returning them to the driver;
+    # format: bin_growth,min_bin,max_bin,max_cached_bytes
+    "CT2_CUDA_ALLOCATOR": "cub_caching",
+    "CT2_CUDA_CACHING_ALLOCATOR_CONFIG": "4,3,12,1073741824",
+    # Pack weights once at load for faster CPU GEMMs (Intel MKL backend only)
+    "CT2_USE_EXPERIMENTAL_PACKED_GEMM": "1",
+}
 
 # Model cache directory (faster-whisper default: ~/.cache/huggingface/hub/)
 # Override with STT_MODELS_DIR environment variable if needed
@@ -28,6 +58,14 @@ DEFAULT_BATCH_SIZE = 16  # Number of parallel batches (higher = faster but more
 DEFAULT_LANGUAGE = None  # None for auto-detect, or "en", "es", "fr", etc.
 DEFAULT_TASK = "transcribe"  # "transcribe" or "translate" (to English)
 
+# Request Batching
+# Concurrent /transcribe requests for short clips with an explicit language are
+# grouped into one batched encoder/decoder pass. VAD is not applied to batched clips.
+BATCHING_ENABLED = os.getenv("STT_BATCHING_ENABLED", "true").lower() == "true"
+MAX_BATCH_SIZE = int(os.getenv("STT_MAX_BATCH_SIZE", 16))  # Max requests per batch
+BATCH_MAX_WAIT_MS = int(os.getenv("STT_BATCH_MAX_WAIT_MS", 15))  # Max time to wait for a batch to fill
+BATCH_MAX_CLIP_SECONDS = 30  # Longer clips are transcribed individually (Whisper window size)
+
 # Advanced Options
 VAD_FILTER = True  # Voice Activity Detection - skip silence
 VAD_THRESHOLD = 0.5
@@ -36,12 +74,19 @@ CONDITION_ON_PREVIOUS_TEXT = True  # Use context from previous segments
 
 # Audio Processing
 MAX_FILE_SIZE_MB = 100  # Maximum upload file size
+UPLOAD_BLOCK_SECONDS = 30  # Audio decoded per block when reading uploads
 SUPPORTED_FORMATS = [".wav", ".mp3", ".m4a", ".flac", ".ogg", ".webm", ".mp4"]
 TARGET_SAMPLE_RATE = 16000  # Whisper expects 16kHz
 
+# Scratch directory for uploaded audio awaiting decode. Defaults to tmpfs (/dev/shm)
+# so per-request temp files never touch disk; override with STT_TEMP_DIR.
+_default_temp_dir = Path("/dev/shm/stt") if Path("/dev/shm").is_dir() else Path(tempfile.gettempdir()) / "stt"
+TEMP_DIR = Path(os.getenv("STT_TEMP_DIR", str(_default_temp_dir)))
+TEMP_DIR.mkdir(parents=True, exist_ok=True)
+
 # Performance
 MODEL_WARMUP_ENABLED = True  # Load model on startup
-WARMUP_AUDIO_DURATION = 5  # seconds of silence for warmup
+WARMUP_AUDIO_DURATION = 5  # seconds of noise for warmup
 
 # WebSocket Configuration
 WS_CHUNK_DURATION = 5  # seconds - buffer duration before transcribing
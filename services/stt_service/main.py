@@ -5,14 +5,18 @@ A FastAPI service for speech-to-text transcription using Whisper Large V3 Turbo.
 Supports both REST API (file upload) and WebSocket (streaming) modes.
 """
 
+import asyncio
 import io
 import logging
+import threading
 import time
-from typing import Optional
+from collections import deque
+from typing import NamedTuple, Optional
 
-from fastapi import FastAPI, File, UploadFile, HTTPException, WebSocket, WebSocketDisconnect, Form
-from fastapi.responses import JSONResponse
+from fastapi import FastAPI, File, UploadFile, HTTPException, Request, WebSocket, WebSocketDisconnect, Form
+from fastapi.responses import JSONResponse, ORJSONResponse
 from pydantic import BaseModel, Field
+import numpy as np
 
 import config
 from transcriber import WhisperTranscriber
@@ -33,11 +37,35 @@ logger = logging.getLogger(__name__)
 app = FastAPI(
     title=config.SERVICE_NAME,
     description="Speech-to-text transcription using Whisper Large V3 Turbo with streaming support",
-    version=config.SERVICE_VERSION
+    version=config.SERVICE_VERSION,
+    default_response_class=ORJSONResponse
 )
 
-# Global transcriber instance (lazy loaded)
+# Scale from int16 PCM to float32 in [-1, 1)
+PCM16_SCALE = np.float32(1.0 / 32768.0)
+
+# Endpoints that accept audio uploads
+UPLOAD_PATHS = ("/transcribe", "/detect-language")
+
+
+@app.middleware("http")
+async def reject_oversized_uploads(request: Request, call_next):
+    """Refuse uploads over the size limit from Content-Length, before the body is read"""
+    if request.url.path in UPLOAD_PATHS:
+        content_length = request.headers.get("content-length")
+        if content_length and content_length.isdigit() and not AudioProcessor.validate_file_size(int(content_length)):
+            return JSONResponse(
+                status_code=413,
+                content={"detail": f"File too large. Maximum size: {config.MAX_FILE_SIZE_MB}MB"}
+            )
+    return await call_next(request)
+
+
+# Global transcriber instance (preloaded at startup, lazily retried if that failed)
 transcriber: Optional[WhisperTranscriber] = None
+transcriber_lock = threading.Lock()
+model_ready = asyncio.Event()  # Set once the model is loaded and warmed up
+preload_task: Optional[asyncio.Task] = None
 audio_processor = AudioProcessor()
 
 
@@ -45,15 +73,136 @@ def get_transcriber() -> WhisperTranscriber:
     """Get or initialize the transcriber instance"""
     global transcriber
     if transcriber is None:
-        logger.info("Initializing Whisper transcriber...")
-        transcriber = WhisperTranscriber(
-            model_size=config.MODEL_SIZE,
-            device=config.DEVICE,
-            compute_type=config.COMPUTE_TYPE
-        )
+        # The startup preload runs in a worker thread; only one caller may load the model
+        with transcriber_lock:
+            if transcriber is None:
+                logger.info("Initializing Whisper transcriber...")
+                transcriber = WhisperTranscriber(
+                    model_size=config.MODEL_SIZE,
+                    device=config.DEVICE,
+                    compute_type=config.COMPUTE_TYPE
+                )
     return transcriber
 
 
+async def get_transcriber_async() -> WhisperTranscriber:
+    """Get the transcriber from a coroutine without blocking the event loop while the model loads"""
+    if transcriber is not None:
+        return transcriber
+    return await asyncio.to_thread(get_transcriber)
+
+
+async def preload_transcriber():
+    """Load the model off the event loop and mark the service ready"""
+    try:
+        await asyncio.to_thread(get_transcriber)
+        model_ready.set()
+        logger.info("Whisper transcriber ready")
+    except Exception as e:
+        logger.error(f"Failed to preload Whisper transcriber: {e}", exc_info=True)
+
+
+@app.on_event("startup")
+async def start_preload():
+    """Start loading the model so the first request doesn't pay for it"""
+    global preload_task
+    preload_task = asyncio.create_task(preload_transcriber())
+
+
+@app.on_event("shutdown")
+async def release_transcriber():
+    """Free the model's device memory before the process exits"""
+    global transcriber
+    if transcriber is not None:
+        logger.info("Unloading Whisper model...")
+        transcriber.model.model.unload_model()
+        transcriber = None
+
+
+# Request Batching
+
+class BatchParams(NamedTuple):
+    """Decoding parameters shared by every clip in one batch"""
+    language: str
+    task: str
+    beam_size: int
+    word_timestamps: bool
+
+
+class BatchItem(NamedTuple):
+    """A queued transcription request awaiting its batch"""
+    audio: np.ndarray
+    params: BatchParams
+    future: asyncio.Future
+
+
+request_queue: Optional[asyncio.Queue] = None
+
+
+async def batch_worker():
+    """Drain request_queue into micro-batches and transcribe each group in one pass"""
+    loop = asyncio.get_running_loop()
+    while True:
+        batch = [await request_queue.get()]
+        deadline = loop.time() + config.BATCH_MAX_WAIT_MS / 1000
+        while len(batch) < config.MAX_BATCH_SIZE:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(request_queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+
+        # One decoder configuration per pass
+        groups: dict[BatchParams, list[BatchItem]] = {}
+        for item in batch:
+            groups.setdefault(item.params, []).append(item)
+
+        for params, items in groups.items():
+            try:
+                trans = await get_transcriber_async()
+                results = await asyncio.to_thread(
+                    trans.transcribe_batch, [item.audio for item in items], **params._asdict()
+                )
+                for item, result in zip(items, results):
+                    if not item.future.done():
+                        item.future.set_result(result)
+            except Exception as e:
+                # Retry each clip on its own so an error only reaches the request that caused it
+                logger.error(f"Batched transcription failed, transcribing clips one by one: {e}", exc_info=True)
+                for item in items:
+                    if item.future.done():
+                        continue
+                    try:
+                        trans = await get_transcriber_async()
+                        result = await asyncio.to_thread(trans.transcribe, item.audio, **params._asdict())
+                        if not item.future.done():
+                            item.future.set_result(result)
+                    except Exception as item_error:
+                        if not item.future.done():
+                            item.future.set_exception(item_error)
+
+
+@app.on_event("startup")
+async def start_batch_worker():
+    """Start the request batching consumer"""
+    global request_queue
+    if config.BATCHING_ENABLED:
+        request_queue = asyncio.Queue()
+        asyncio.create_task(batch_worker())
+        logger.info(f"Request batching enabled (max batch: {config.MAX_BATCH_SIZE}, max wait: {config.BATCH_MAX_WAIT_MS}ms)")
+
+
+def can_batch(audio: np.ndarray, language: Optional[str]) -> bool:
+    """Whether a request can join a batch (short clip with a known language)"""
+    return (
+        request_queue is not None
+        and language is not None
+        and len(audio) <= config.BATCH_MAX_CLIP_SECONDS * config.TARGET_SAMPLE_RATE
+    )
+
+
 # Pydantic Models
 class TranscriptionResponse(BaseModel):
     """Response model for transcription"""
@@ -82,7 +231,9 @@ class ErrorResponse(BaseModel):
 
 # REST API Endpoints
 
-@app.post("/transcribe", response_model=TranscriptionResponse)
+# No response_model: the transcriber already returns a well-formed dict, and validating
+# it would walk every segment and word again. The schema is still published for OpenAPI.
+@app.post("/transcribe", response_model=None, responses={200: {"model": TranscriptionResponse}})
 async def transcribe_audio(
     file: UploadFile = File(..., description="Audio file to transcribe"),
     language: Optional[str] = Form(None, description="Language code (e.g., 'en', 'es', 'fr'). None for auto-detect."),
@@ -98,11 +249,10 @@ async def transcribe_audio(
     Returns transcription with timestamps and language detection.
     """
     try:
-        # Validate file size
-        contents = await file.read()
-        file_size = len(contents)
+        # Validate file size (oversized requests were already refused by reject_oversized_uploads)
+        file_size = file.size
 
-        if not audio_processor.validate_file_size(file_size):
+        if file_size is not None and not audio_processor.validate_file_size(file_size):
             raise HTTPException(
                 status_code=413,
                 detail=f"File too large. Maximum size: {config.MAX_FILE_SIZE_MB}MB"
@@ -115,25 +265,32 @@ async def transcribe_audio(
                 detail=f"Unsupported format. Supported: {', '.join(config.SUPPORTED_FORMATS)}"
             )
 
-        logger.info(f"Received file: {file.filename} ({file_size / 1024:.1f} KB)")
+        logger.info(f"Received file: {file.filename} ({(file_size or 0) / 1024:.1f} KB)")
 
-        # Load audio
+        # Load audio, decoding straight from the spooled upload
         try:
-            audio = audio_processor.load_audio_from_bytes(contents, file.filename)
+            audio = audio_processor.load_audio_from_upload(file.file, file.filename)
         except Exception as e:
             raise HTTPException(status_code=400, detail=f"Failed to load audio: {str(e)}")
 
-        # Get transcriber
-        trans = get_transcriber()
-
-        # Transcribe
-        result = trans.transcribe(
-            audio,
-            language=language,
-            task=task,
-            beam_size=beam_size,
-            word_timestamps=word_timestamps,
-        )
+        if can_batch(audio, language):
+            # Queue for the batch worker and wait for this clip's result
+            future = asyncio.get_running_loop().create_future()
+            params = BatchParams(language, task, beam_size, word_timestamps)
+            await request_queue.put(BatchItem(audio, params, future))
+            result = await future
+        else:
+            # Get transcriber
+            trans = await get_transcriber_async()
+
+            # Transcribe
+            result = trans.transcribe(
+                audio,
+                language=language,
+                task=task,
+                beam_size=beam_size,
+                word_timestamps=word_timestamps,
+            )
 
         logger.info(f"Transcription successful: {len(result['text'])} characters")
 
@@ -154,17 +311,14 @@ async def detect_language(file: UploadFile = File(...)):
     Quickly detects the spoken language without full transcription.
     """
     try:
-        # Read file
-        contents = await file.read()
-
-        if not audio_processor.validate_file_size(len(contents)):
+        if file.size is not None and not audio_processor.validate_file_size(file.size):
             raise HTTPException(status_code=413, detail="File too large")
 
-        # Load audio
-        audio = audio_processor.load_audio_from_bytes(contents, file.filename)
+        # Load audio, decoding straight from the spooled upload
+        audio = audio_processor.load_audio_from_upload(file.file, file.filename)
 
         # Get transcriber
-        trans = get_transcriber()
+        trans = await get_transcriber_async()
 
         # Detect language
         result = trans.detect_language(audio)
@@ -182,10 +336,20 @@ async def detect_language(file: UploadFile = File(...)):
 
 @app.get("/health")
 async def health_check():
-    """Health check endpoint"""
+    """Health check endpoint (503 until the model is loaded)"""
+    if not model_ready.is_set() and preload_task is not None and not preload_task.done():
+        return JSONResponse(
+            status_code=503,
+            content={
+                "status": "loading",
+                "service": config.SERVICE_NAME,
+            }
+        )
+
     try:
-        # Try to get transcriber (will initialize if needed)
-        trans = get_transcriber()
+        # Returns the preloaded model, or retries loading if the preload failed
+        trans = await get_transcriber_async()
+        model_ready.set()
         model_info = trans.get_model_info()
 
         return {
@@ -219,7 +383,7 @@ async def list_languages():
 async def get_model_info():
     """Get information about the loaded model"""
     try:
-        trans = get_transcriber()
+        trans = await get_transcriber_async()
         return trans.get_model_info()
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -249,47 +413,83 @@ async def root():
 # WebSocket Endpoint
 
 @app.websocket("/ws/transcribe")
-async def websocket_transcribe(websocket: WebSocket):
+async def websocket_transcribe(
+    websocket: WebSocket,
+    sample_rate: int = config.TARGET_SAMPLE_RATE,
+    channels: int = 1,
+):
     """
     WebSocket endpoint for streaming transcription
 
-    Client should send audio chunks as binary data.
-    Server responds with JSON transcription results.
+    Client should send raw mono 16-bit little-endian PCM at 16 kHz as binary
+    messages (no container). Every config.WS_CHUNK_DURATION seconds of audio
+    the server responds with a JSON transcription result for that window.
+
+    The stream format may be declared with the sample_rate and channels query
+    parameters; any other format is closed with code 1003 right after the
+    handshake, so no resampling or downmixing happens on this path.
     """
+    # Accept first: closing before accept is turned into an HTTP 403, and the
+    # client would never see the close code or reason
     await websocket.accept()
+
+    if sample_rate != config.TARGET_SAMPLE_RATE or channels != 1:
+        logger.warning(f"Rejected WebSocket stream: {sample_rate}Hz, {channels} channel(s)")
+        await websocket.close(code=1003, reason=f"Expected mono PCM16 at {config.TARGET_SAMPLE_RATE}Hz")
+        return
+
     logger.info("WebSocket connection established")
 
-    audio_buffer = []
+    window_samples = int(config.WS_CHUNK_DURATION * config.TARGET_SAMPLE_RATE)
+    window = np.empty(window_samples, dtype=np.float32)  # Reused for every window
+    pending = deque()  # Decoded float32 PCM not yet transcribed
+    pending_samples = 0
     chunk_count = 0
+    window_count = 0
 
     try:
-        trans = get_transcriber()
+        trans = await get_transcriber_async()
 
         while True:
             # Receive audio data
             data = await websocket.receive_bytes()
             chunk_count += 1
 
-            # Buffer audio chunks
-            audio_buffer.append(data)
-
             logger.debug(f"Received chunk {chunk_count}: {len(data)} bytes")
 
-            # Process when buffer reaches threshold
-            # Note: This is a simple implementation - production would use VAD
-            if len(audio_buffer) >= 10:  # ~5 seconds at typical chunk rates
-                try:
-                    # Concatenate buffer
-                    audio_bytes = b''.join(audio_buffer)
+            if len(data) % 2:
+                await websocket.send_json({
+                    "status": "error",
+                    "error": "Audio must be 16-bit PCM (even number of bytes per message)"
+                })
+                continue
+
+            # One int16 -> float32 widening copy, scaled in place
+            samples = np.frombuffer(data, dtype="<i2").astype(np.float32)
+            samples *= PCM16_SCALE
+            pending.append(samples)
+            pending_samples += len(samples)
+
+            # Transcribe each full window; any overshoot carries into the next one
+            while pending_samples >= window_samples:
+                filled = 0
+                while filled < window_samples:
+                    head = pending.popleft()
+                    take = min(len(head), window_samples - filled)
+                    window[filled:filled + take] = head[:take]
+                    if take < len(head):
+                        pending.appendleft(head[take:])
+                    filled += take
+                pending_samples -= window_samples
+                window_count += 1
 
-                    # Load and transcribe
-                    audio = audio_processor.load_audio_from_bytes(audio_bytes, "chunk.wav")
-                    result = trans.transcribe(audio, beam_size=3, word_timestamps=False)
+                try:
+                    result = trans.transcribe(window, beam_size=3, word_timestamps=False)
 
                     # Send result
                     await websocket.send_json({
                         "status": "success",
-                        "chunk": chunk_count // 10,
+                        "chunk": window_count,
                         "text": result["text"],
                         "language": result["language"],
                         "duration": result["duration"],
@@ -298,16 +498,12 @@ async def websocket_transcribe(websocket: WebSocket):
 
                     logger.info(f"Transcribed chunk: {result['text'][:50]}...")
 
-                    # Clear buffer
-                    audio_buffer.clear()
-
                 except Exception as e:
                     logger.error(f"Transcription error in WebSocket: {e}")
                     await websocket.send_json({
                         "status": "error",
                         "error": str(e)
                     })
-                    audio_buffer.clear()
 
     except WebSocketDisconnect:
         logger.info("WebSocket connection closed by client")
@@ -3,15 +3,104 @@ Whisper Transcriber - Wrapper for faster-whisper model
 """
 
 import logging
+import os
+import subprocess
 import time
-from typing import Optional, Dict, List, Any
+from typing import Optional, Dict, List, Any, Tuple
 import numpy as np
 
-from faster_whisper import WhisperModel, BatchedInferencePipeline
 import config
 
+# CTranslate2 reads its runtime settings from the environment, so export them
+# before faster-whisper (and with it ctranslate2) is imported
+for _key, _value in config.CT2_ENV.items():
+    os.environ.setdefault(_key, _value)
+
+from faster_whisper import WhisperModel, BatchedInferencePipeline, decode_audio
+from faster_whisper.audio import pad_or_trim
+from faster_whisper.feature_extractor import FeatureExtractor
+
 logger = logging.getLogger(__name__)
 
+# torch is optional: only used to compute log-mel features on the GPU
+try:
+    import torch
+except ImportError:
+    torch = None
+
+
+def get_cuda_compute_capability() -> Optional[Tuple[int, int]]:
+    """
+    Get the CUDA compute capability of the first GPU via nvidia-smi
+
+    Returns:
+        (major, minor) tuple, or None if no GPU or nvidia-smi is unavailable
+    """
+    try:
+        result = subprocess.run(
+            ["nvidia-smi", "--query-gpu=compute_cap", "--format=csv,noheader,nounits"],
+            capture_output=True, text=True, timeout=10
+        )
+        if result.returncode == 0:
+            lines = result.stdout.strip().splitlines()
+            if lines:
+                major, minor = lines[0].strip().split(".")
+                return int(major), int(minor)
+    except (subprocess.TimeoutExpired, FileNotFoundError, ValueError) as e:
+        logger.warning(f"Could not get GPU compute capability: {e}")
+    return None
+
+
+class GpuMelExtractor(FeatureExtractor):
+    """
+    Drop-in replacement for faster-whisper's NumPy log-mel extractor that runs
+    the STFT and mel projection on the GPU with torch
+
+    The Hann window and mel filter bank are kept resident on the device, so
+    each call only uploads the waveform and downloads the (n_mels, frames)
+    features the pipeline expects.
+    """
+
+    def __init__(self, base: FeatureExtractor, device: str = "cuda"):
+        self.__dict__.update(base.__dict__)
+        self.device = device
+        self.window = torch.hann_window(self.n_fft, device=device)
+        self.mel_filters_gpu = torch.from_numpy(self.mel_filters).to(device)
+
+    def __call__(self, waveform: np.ndarray, padding=160, chunk_length=None):
+        """Compute the log-Mel spectrogram of the provided audio"""
+        # Reflect padding needs more samples than n_fft // 2; the reference
+        # extractor handles such short (or empty) inputs, so defer to it
+        if len(waveform) + padding <= self.n_fft // 2:
+            return super().__call__(waveform, padding=padding, chunk_length=chunk_length)
+
+        if chunk_length is not None:
+            self.n_samples = chunk_length * self.sampling_rate
+            self.nb_max_frames = self.n_samples // self.hop_length
+
+        audio = torch.as_tensor(np.asarray(waveform, dtype=np.float32), device=self.device)
+        if padding:
+            audio = torch.nn.functional.pad(audio, (0, padding))
+
+        stft = torch.stft(
+            audio,
+            self.n_fft,
+            self.hop_length,
+            window=self.window,
+            center=True,
+            pad_mode="reflect",
+            return_complex=True,
+        )
+        magnitudes = stft[..., :-1].abs() ** 2
+
+        mel_spec = self.mel_filters_gpu @ magnitudes
+
+        log_spec = torch.clamp(mel_spec, min=1e-10).log10()
+        log_spec = torch.maximum(log_spec, log_spec.max() - 8.0)
+        log_spec = (log_spec + 4.0) / 4.0
+
+        return log_spec.cpu().numpy()
+
 
 class WhisperTranscriber:
     """Wrapper class for Whisper transcription with faster-whisper"""
@@ -20,7 +109,7 @@ class WhisperTranscriber:
         self,
         model_size: str = config.MODEL_SIZE,
         device: str = config.DEVICE,
-        compute_type: str = config.COMPUTE_TYPE,
+        compute_type: Optional[str] = config.COMPUTE_TYPE,
         download_root: Optional[str] = None,
     ):
         """
@@ -29,29 +118,51 @@ class WhisperTranscriber:
         Args:
             model_size: Model size (tiny, base, small, medium, large-v2, large-v3, large-v3-turbo)
             device: Device to use (cuda, cpu, auto)
-            compute_type: Computation type (float16, int8_float16, int8)
+            compute_type: Computation type (float16, int8_float16, int8), or None
+                to select one from the GPU's compute capability
             download_root: Directory to download models to
         """
         self.model_size = model_size
         self.device = device
+        if compute_type is None:
+            compute_type = self._select_compute_type(device)
         self.compute_type = compute_type
         self.model = None
         self.batched_model = None
+        self.flash_attention = self._use_flash_attention(device)
 
         logger.info(f"Initializing Whisper model: {model_size}")
-        logger.info(f"Device: {device}, Compute type: {compute_type}")
+        logger.info(f"Device: {device}, Compute type: {compute_type}, Flash attention: {self.flash_attention}")
 
         try:
             start_time = time.time()
 
             # Initialize model
+            download_root = str(config.MODELS_DIR) if download_root is None else download_root
             self.model = WhisperModel(
                 model_size,
                 device=device,
                 compute_type=compute_type,
-                download_root=str(config.MODELS_DIR) if download_root is None else download_root,
+                download_root=download_root,
+                flash_attention=self.flash_attention,
             )
 
+            # Not every CTranslate2 build ships the flash attention kernels; those that
+            # don't load fine but fail on every encode, so check once and reload without it
+            if self.flash_attention and not self._flash_attention_works():
+                self.flash_attention = False
+                self.model = WhisperModel(
+                    model_size,
+                    device=device,
+                    compute_type=compute_type,
+                    download_root=download_root,
+                    flash_attention=False,
+                )
+
+            if self._use_gpu_features(device):
+                self.model.feature_extractor = GpuMelExtractor(self.model.feature_extractor)
+                logger.info("Computing log-mel features on GPU")
+
             # Initialize batched inference pipeline for better performance
             self.batched_model = BatchedInferencePipeline(model=self.model)
 
@@ -66,23 +177,90 @@ class WhisperTranscriber:
             logger.error(f"Failed to initialize Whisper model: {e}")
             raise
 
+    @staticmethod
+    def _select_compute_type(device: str) -> str:
+        """Pick the compute type matching the hardware's fastest native matmul path"""
+        if device != "cuda":
+            compute_type = "int8"
+        else:
+            capability = get_cuda_compute_capability()
+            if capability is None:
+                compute_type = config.DEFAULT_GPU_COMPUTE_TYPE
+            elif capability >= (8, 0):
+                compute_type = "int8_float16"  # Ampere+: int8 and fp16 tensor cores
+            elif capability >= (7, 0):
+                compute_type = "float16"  # Volta/Turing: fp16 tensor cores
+            else:
+                compute_type = "int8"  # No tensor cores: avoid slow fp16 paths
+            logger.info(f"GPU compute capability: {capability}")
+
+        logger.info(f"Selected compute type: {compute_type} (set STT_COMPUTE_TYPE to override)")
+        return compute_type
+
+    @staticmethod
+    def _use_flash_attention(device: str) -> bool:
+        """Enable flash attention only when configured and the GPU is Ampere or newer"""
+        if not config.FLASH_ATTN or device != "cuda":
+            return False
+
+        capability = get_cuda_compute_capability()
+        if capability is None or capability < config.FLASH_ATTN_MIN_COMPUTE_CAPABILITY:
+            logger.info(f"Flash attention disabled (compute capability: {capability})")
+            return False
+        return True
+
+    def _flash_attention_works(self) -> bool:
+        """Encode one second of silence to check the model's flash attention kernels run"""
+        try:
+            silence = np.zeros(config.TARGET_SAMPLE_RATE, dtype=np.float32)
+            features = pad_or_trim(self.model.feature_extractor(silence)[..., :-1])
+            self.model.encode(features)
+            return True
+        except RuntimeError as e:
+            logger.warning(f"Flash attention unavailable in this CTranslate2 build, disabling it: {e}")
+            return False
+
+    @staticmethod
+    def _use_gpu_features(device: str) -> bool:
+        """Move feature extraction to the GPU when configured and torch with CUDA is installed"""
+        if not config.GPU_FEATURE_EXTRACTION or device != "cuda":
+            return False
+        if torch is None or not torch.cuda.is_available():
+            logger.info("GPU feature extraction unavailable (torch with CUDA not installed), using CPU")
+            return False
+        return True
+
     def _warmup(self):
-        """Warm up the model with a short audio sample"""
+        """Warm up the model on every decode path real requests take"""
         try:
             logger.info("Warming up model...")
-            # Generate 5 seconds of silence
+            # Low-level white noise rather than silence: silence lets the decoder
+            # stop after a token or two, so the longer decode loops and their
+            # kernel selection would otherwise be left to the first real request
             sample_rate = config.TARGET_SAMPLE_RATE
             duration = config.WARMUP_AUDIO_DURATION
-            silence = np.zeros(sample_rate * duration, dtype=np.float32)
+            rng = np.random.default_rng(0)
+            noise = (rng.standard_normal(sample_rate * duration) * 0.05).astype(np.float32)
+
+            # Sequential model with greedy and default beam search
+            for beam_size in sorted({1, config.DEFAULT_BEAM_SIZE}):
+                segments, _ = self.model.transcribe(
+                    noise,
+                    beam_size=beam_size,
+                    language="en",
+                    vad_filter=False,
+                    condition_on_previous_text=False,
+                )
+                # Consume generator
+                list(segments)
 
-            # Run a quick transcription
-            segments, _ = self.model.transcribe(
-                silence,
-                beam_size=1,
+            # Batched pipeline at full batch width, as used by request batching
+            self.transcribe_batch(
+                [noise] * config.DEFAULT_BATCH_SIZE,
                 language="en",
+                beam_size=config.DEFAULT_BEAM_SIZE,
+                word_timestamps=False,
             )
-            # Consume generator
-            list(segments)
 
             logger.info("Model warmup complete")
         except Exception as e:
@@ -135,25 +313,7 @@ class WhisperTranscriber:
             full_text = []
 
             for segment in segments:
-                segment_data = {
-                    "start": segment.start,
-                    "end": segment.end,
-                    "text": segment.text,
-                }
-
-                # Add word timestamps if available
-                if word_timestamps and hasattr(segment, "words") and segment.words:
-                    segment_data["words"] = [
-                        {
-                            "word": word.word,
-                            "start": word.start,
-                            "end": word.end,
-                            "probability": word.probability,
-                        }
-                        for word in segment.words
-                    ]
-
-                segments_list.append(segment_data)
+                segments_list.append(self._segment_to_dict(segment, word_timestamps))
                 full_text.append(segment.text)
 
             # Combine all text
@@ -187,6 +347,123 @@ class WhisperTranscriber:
             logger.error(f"Transcription failed: {e}", exc_info=True)
             raise
 
+    @staticmethod
+    def _segment_to_dict(segment, word_timestamps: bool, offset: float = 0.0) -> Dict[str, Any]:
+        """
+        Convert a faster-whisper segment to a response dict
+
+        Args:
+            segment: Segment yielded by faster-whisper
+            word_timestamps: Include word-level timestamps
+            offset: Seconds to subtract from all timestamps (start of the clip
+                within a concatenated batch)
+
+        Returns:
+            Segment dictionary with start, end, text and optional words
+        """
+        segment_data = {
+            "start": segment.start - offset,
+            "end": segment.end - offset,
+            "text": segment.text,
+        }
+
+        # Add word timestamps if available
+        if word_timestamps and hasattr(segment, "words") and segment.words:
+            segment_data["words"] = [
+                {
+                    "word": word.word,
+                    "start": word.start - offset,
+                    "end": word.end - offset,
+                    "probability": word.probability,
+                }
+                for word in segment.words
+            ]
+
+        return segment_data
+
+    def transcribe_batch(
+        self,
+        audios: List[np.ndarray],
+        language: Optional[str],
+        task: str = "transcribe",
+        beam_size: int = config.DEFAULT_BEAM_SIZE,
+        word_timestamps: bool = config.WORD_TIMESTAMPS,
+        batch_size: Optional[int] = None,
+    ) -> List[Dict[str, Any]]:
+        """
+        Transcribe several short clips in one batched encoder/decoder pass
+
+        Clips are concatenated and passed to the batched pipeline as explicit
+        clip_timestamps, so each clip becomes one item of the same batch.
+        Resulting segments are mapped back to their clip by start time.
+
+        Args:
+            audios: Numpy arrays, each at most config.BATCH_MAX_CLIP_SECONDS long
+            language: Language code. None detects it once, from the first
+                clip, and applies it to every clip, so only pass None for
+                clips from the same stream.
+            task: "transcribe" or "translate"
+            beam_size: Beam size for decoding (1-10)
+            word_timestamps: Include word-level timestamps
+            batch_size: Clips per encoder/decoder pass (default: all of them)
+
+        Returns:
+            List of transcription results, one per input clip
+        """
+        start_time = time.time()
+        sample_rate = config.TARGET_SAMPLE_RATE
+
+        # Offsets (in seconds) of each clip within the concatenated buffer;
+        # faster-whisper >= 1.2 reads clip_timestamps as seconds, not samples
+        offsets = np.cumsum([0] + [len(audio) for audio in audios]) / sample_rate
+        clip_timestamps = [
+            {"start": float(offsets[i]), "end": float(offsets[i + 1])}
+            for i in range(len(audios))
+        ]
+        clip_starts = offsets[:-1]
+
+        logger.info(f"Starting batched transcription of {len(audios)} clips (language: {language or 'auto'}, task: {task})")
+
+        segments, info = self.batched_model.transcribe(
+            np.concatenate(audios),
+            language=language,
+            task=task,
+            beam_size=beam_size,
+            batch_size=batch_size or len(audios),
+            word_timestamps=word_timestamps,
+            clip_timestamps=clip_timestamps,
+        )
+
+        segments_per_clip = [[] for _ in audios]
+        for segment in segments:
+            # Assign by segment midpoint; start times are rounded and may land a hair before the clip start
+            midpoint = (segment.start + segment.end) / 2
+            clip_index = max(int(np.searchsorted(clip_starts, midpoint, side="right")) - 1, 0)
+            segments_per_clip[clip_index].append(
+                self._segment_to_dict(segment, word_timestamps, offset=clip_starts[clip_index])
+            )
+
+        processing_time = time.time() - start_time
+        logger.info(f"Batched transcription complete: {len(audios)} clips in {processing_time:.2f}s")
+
+        results = []
+        for audio, clip_segments in zip(audios, segments_per_clip):
+            duration = len(audio) / sample_rate
+            result = {
+                "text": " ".join(segment["text"] for segment in clip_segments).strip(),
+                "segments": clip_segments,
+                "language": info.language if config.INCLUDE_LANGUAGE_DETECTION else None,
+                "language_probability": info.language_probability if config.INCLUDE_LANGUAGE_DETECTION else None,
+                "duration": duration,
+                "processing_time": processing_time,
+                "model": self.model_size,
+            }
+            if duration > 0:
+                result["real_time_factor"] = processing_time / duration
+            results.append(result)
+
+        return results
+
     def transcribe_streaming(
         self,
         audio_chunks: List[np.ndarray],
@@ -196,6 +473,10 @@ class WhisperTranscriber:
         """
         Transcribe audio chunks for streaming scenarios
 
+        Chunks up to config.BATCH_MAX_CLIP_SECONDS long are transcribed together
+        in one batched call (see transcribe_batch); longer chunks, or a failed
+        batch, fall back to transcribing each chunk on its own.
+
         Args:
             audio_chunks: List of audio numpy arrays
             language: Language code (None for auto-detect)
@@ -204,6 +485,20 @@ class WhisperTranscriber:
         Returns:
             List of transcription results for each chunk
         """
+        max_clip_samples = config.BATCH_MAX_CLIP_SECONDS * config.TARGET_SAMPLE_RATE
+        if audio_chunks and all(len(chunk) <= max_clip_samples for chunk in audio_chunks):
+            try:
+                return self.transcribe_batch(
+                    [np.asarray(chunk, dtype=np.float32) for chunk in audio_chunks],
+                    language=language,
+                    task=kwargs.get("task", "transcribe"),
+                    beam_size=kwargs.get("beam_size", config.DEFAULT_BEAM_SIZE),
+                    word_timestamps=kwargs.get("word_timestamps", config.WORD_TIMESTAMPS),
+                    batch_size=min(len(audio_chunks), config.DEFAULT_BATCH_SIZE),
+                )
+            except Exception as e:
+                logger.warning(f"Batched chunk transcription failed, transcribing chunks one by one: {e}")
+
         results = []
 
         for i, chunk in enumerate(audio_chunks):
@@ -236,21 +531,25 @@ class WhisperTranscriber:
             Dictionary with language detection results
         """
         try:
-            # Transcribe first 30 seconds to detect language
-            segments, info = self.model.transcribe(
-                audio,
-                language=None,  # Auto-detect
-                beam_size=1,  # Fast detection
-                word_timestamps=False,
-            )
-
-            # Consume generator (we only need the info)
-            list(segments)
+            # Whisper identifies the language from a single 30-second window,
+            # so only that prefix is encoded
+            sample_rate = config.TARGET_SAMPLE_RATE
+            max_samples = 30 * sample_rate
+            if isinstance(audio, str):
+                # faster-whisper's decoder handles every container and resamples
+                audio = decode_audio(audio, sampling_rate=sample_rate)
+            duration = len(audio) / sample_rate
+            audio = audio[:max_samples]
+
+            if self.model.model.is_multilingual:
+                language, language_probability, _ = self.model.detect_language(audio=audio)
+            else:
+                language, language_probability = "en", 1.0
 
             return {
-                "language": info.language,
-                "language_probability": info.language_probability,
-                "duration": info.duration,
+                "language": language,
+                "language_probability": language_probability,
+                "duration": duration,
             }
 
         except Exception as e:
@@ -263,6 +562,7 @@ class WhisperTranscriber:
             "model_size": self.model_size,
             "device": self.device,
             "compute_type": self.compute_type,
+            "flash_attention": self.flash_attention,
             "supported_languages": len(config.SUPPORTED_LANGUAGES),
             "word_timestamps": config.WORD_TIMESTAMPS,
             "vad_filter": config.VAD_FILTER,
@@ -5,9 +5,12 @@ A FastAPI service for streaming text-to-speech generation using the Kokoro-82M m
 Provides real-time audio streaming with support for multiple voices and languages.
 """
 
-import io
+import asyncio
+import hashlib
 import logging
-import wave
+import os
+import struct
+from collections import OrderedDict
 from typing import Optional
 
 import numpy as np
@@ -33,10 +36,24 @@ app = FastAPI(
     version="1.0.0"
 )
 
-# Global pipeline instance (lazy loaded)
-pipeline = None
+# Kokoro pipelines by language code (lazy loaded, least recently used evicted first).
+# They all share one KModel, so a pipeline only adds its language's G2P front end.
+shared_model = None
+pipelines: OrderedDict = OrderedDict()
+pipeline_lock = asyncio.Lock()
+PIPELINE_CACHE_MAX = 4
 SAMPLE_RATE = 24000
 
+# Cache of finished WAV bytes keyed by request, bounded by total size
+TTS_CACHE_MAX_BYTES = int(os.getenv("TTS_CACHE_MAX_MB", "256")) * 1024 * 1024
+
+# Phrases synthesized into the cache at startup with the default voice ("|"-separated)
+PREWARM_PHRASES = [p.strip() for p in os.getenv("TTS_PREWARM_PHRASES", "").split("|") if p.strip()]
+
+# RIFF/WAVE header layout: RIFF chunk, fmt chunk (PCM), data chunk header
+WAV_HEADER = struct.Struct("<4sI4s4sIHHIIHH4sI")
+WAV_UNKNOWN_SIZE = 0xFFFFFFFF  # Sentinel chunk size for streams of unknown length
+
 # Available voices for each language
 VOICES = {
     "en": ["af_heart", "af_bella", "af_sarah", "af_nicole", "am_adam", "am_michael", "bf_emma", "bf_isabella", "bm_george", "bm_lewis"],
@@ -72,53 +89,152 @@ class TTSRequest(BaseModel):
     format: str = Field(default="wav", description="Audio format (currently only wav supported)")
 
 
-def get_pipeline(lang_code: str = "a"):
-    """Initialize or return cached Kokoro pipeline"""
-    global pipeline
+def load_model():
+    """Load the Kokoro model shared by every language's pipeline"""
+    import torch
+    from kokoro import KModel
+
+    device = "cuda" if torch.cuda.is_available() else "cpu"
+    logger.info(f"Loading Kokoro model on {device}")
+    return KModel().to(device).eval()
 
+
+async def get_pipeline(lang_code: str = "a"):
+    """Initialize or return cached Kokoro pipeline"""
+    pipe = pipelines.get(lang_code)
+    if pipe is not None:
+        pipelines.move_to_end(lang_code)
+        return pipe
+
+    # Serialize cold loads so concurrent requests for the same language build it once
+    async with pipeline_lock:
+        pipe = pipelines.get(lang_code)
+        if pipe is not None:
+            pipelines.move_to_end(lang_code)
+            return pipe
+
+        global shared_model
+        try:
+            from kokoro import KPipeline
+
+            if shared_model is None:
+                shared_model = await asyncio.to_thread(load_model)
+
+            logger.info(f"Initializing Kokoro pipeline with language code: {lang_code}")
+            pipe = await asyncio.to_thread(KPipeline, lang_code=lang_code, model=shared_model)
+
+        except Exception as e:
+            logger.error(f"Failed to initialize Kokoro pipeline: {e}")
+            raise HTTPException(status_code=500, detail=f"Failed to initialize TTS pipeline: {str(e)}")
+
+        pipelines[lang_code] = pipe
+        if len(pipelines) > PIPELINE_CACHE_MAX:
+            # Only the language front end is dropped; the shared model stays loaded.
+            # Requests still using the evicted pipeline hold their own reference,
+            # so it is only freed once the last of them finishes
+            evicted_code, evicted = pipelines.popitem(last=False)
+            # Drop our reference before emptying the CUDA cache, or its memory is still in use
+            del evicted
+            logger.info(f"Evicted Kokoro pipeline for language code: {evicted_code}")
+            release_gpu_memory()
+
+        return pipe
+
+
+def release_gpu_memory():
+    """Return cached CUDA blocks to the driver after a pipeline is dropped"""
     try:
-        from kokoro import KPipeline
+        import torch
 
-        # Create new pipeline for the requested language
-        # Note: We create a new pipeline each time to support language switching
-        logger.info(f"Initializing Kokoro pipeline with language code: {lang_code}")
-        return KPipeline(lang_code=lang_code)
+        if torch.cuda.is_available():
+            torch.cuda.empty_cache()
+    except ImportError:
+        pass
 
-    except Exception as e:
-        logger.error(f"Failed to initialize Kokoro pipeline: {e}")
-        raise HTTPException(status_code=500, detail=f"Failed to initialize TTS pipeline: {str(e)}")
 
+class AudioCache:
+    """LRU cache of generated WAV bytes with a total byte budget"""
 
-def numpy_to_wav_bytes(audio: np.ndarray, sample_rate: int = SAMPLE_RATE) -> bytes:
-    """Convert numpy audio array to WAV bytes"""
-    # Ensure audio is in the correct format
-    if audio.dtype != np.int16:
-        # Convert float to int16
-        audio = (audio * 32767).astype(np.int16)
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.total_bytes = 0
+        self.entries: OrderedDict = OrderedDict()
+
+    def get(self, key: str) -> Optional[bytes]:
+        audio = self.entries.get(key)
+        if audio is not None:
+            self.entries.move_to_end(key)
+        return audio
+
+    def put(self, key: str, audio: bytes):
+        if len(audio) > self.max_bytes:
+            return
+
+        old = self.entries.pop(key, None)
+        if old is not None:
+            self.total_bytes -= len(old)
+
+        self.entries[key] = audio
+        self.total_bytes += len(audio)
+        while self.total_bytes > self.max_bytes:
+            _, evicted = self.entries.popitem(last=False)
+            self.total_bytes -= len(evicted)
+
+
+audio_cache = AudioCache(TTS_CACHE_MAX_BYTES)
+
+
+def tts_cache_key(processed_text: str, voice: str, speed: float, language: str) -> str:
+    """Cache key for a synthesis request, taken after text preprocessing"""
+    return hashlib.sha1(f"{voice}|{speed}|{language}|{processed_text}".encode("utf-8")).hexdigest()
+
+
+def float_to_pcm16(audio: np.ndarray) -> np.ndarray:
+    """Convert float audio in [-1, 1] to int16 PCM, clipping out-of-range samples"""
+    if audio.dtype == np.int16:
+        return audio
 
-    # Create in-memory WAV file
-    wav_buffer = io.BytesIO()
-    with wave.open(wav_buffer, 'wb') as wav_file:
-        wav_file.setnchannels(1)  # Mono
-        wav_file.setsampwidth(2)  # 16-bit
-        wav_file.setframerate(sample_rate)
-        wav_file.writeframes(audio.tobytes())
+    # Scale into a single float32 scratch buffer, clip in place, then narrow
+    scaled = np.multiply(audio, 32767.0, dtype=np.float32)
+    np.clip(scaled, -32768, 32767, out=scaled)
+    return scaled.astype(np.int16)
 
-    wav_buffer.seek(0)
-    return wav_buffer.read()
 
+def wav_header(data_size: int, sample_rate: int = SAMPLE_RATE) -> bytes:
+    """Build the 44-byte RIFF header for mono 16-bit PCM with data_size bytes of samples"""
+    return WAV_HEADER.pack(
+        b"RIFF", min(36 + data_size, WAV_UNKNOWN_SIZE), b"WAVE",
+        b"fmt ", 16, 1, 1,  # PCM format chunk, 1 channel (mono)
+        sample_rate, sample_rate * 2, 2, 16,  # byte rate, block align, 16-bit
+        b"data", data_size,
+    )
 
-async def generate_audio_stream(text: str, voice: str, speed: float, language: str):
+
+# Header for streamed output whose length isn't known up front; players treat
+# the maximal size as "read until end of stream"
+STREAMING_WAV_HEADER = wav_header(WAV_UNKNOWN_SIZE)
+
+
+def numpy_to_wav_bytes(audio: np.ndarray, sample_rate: int = SAMPLE_RATE) -> bytes:
+    """Convert numpy audio array to WAV bytes"""
+    pcm = float_to_pcm16(audio)
+    return wav_header(pcm.nbytes, sample_rate) + pcm.tobytes()
+
+
+async def generate_audio_stream(processed_text: str, voice: str, speed: float, language: str, cache_key: str):
     """Generator function for streaming audio chunks"""
-    try:
-        # Preprocess text for TTS
-        processed_text = preprocess_for_tts(text)
+    cached = audio_cache.get(cache_key)
+    if cached is not None:
+        logger.info(f"Serving cached speech for text: {processed_text[:50]}...")
+        yield cached
+        return
 
+    try:
         # Get language code
         lang_code = LANG_CODES.get(language, "a")
 
         # Initialize pipeline
-        pipe = get_pipeline(lang_code)
+        pipe = await get_pipeline(lang_code)
 
         # Generate audio using Kokoro
         logger.info(f"Generating speech for text: {processed_text[:50]}... (voice: {voice}, speed: {speed})")
@@ -126,23 +242,29 @@ async def generate_audio_stream(text: str, voice: str, speed: float, language: s
 
         # Track if this is the first chunk
         first_chunk = True
-        all_audio = []
+        total_samples = 0
+        pcm_chunks = []
 
-        # Stream audio chunks
+        # Stream audio chunks as they are generated: a WAV header with an
+        # open-ended data size first, then raw PCM for each chunk
         for i, (graphemes, phonemes, audio) in enumerate(generator):
             logger.info(f"Generated chunk {i}: {len(audio)} samples")
 
-            # Collect all audio chunks
-            all_audio.append(audio)
-
-        # Concatenate all audio chunks
-        if all_audio:
-            full_audio = np.concatenate(all_audio)
-            logger.info(f"Total audio length: {len(full_audio)} samples ({len(full_audio)/SAMPLE_RATE:.2f} seconds)")
-
-            # Convert to WAV and yield
-            wav_bytes = numpy_to_wav_bytes(full_audio, SAMPLE_RATE)
-            yield wav_bytes
+            if first_chunk:
+                yield STREAMING_WAV_HEADER
+                first_chunk = False
+
+            pcm = float_to_pcm16(np.asarray(audio, dtype=np.float32))
+            pcm_bytes = pcm.tobytes()
+            total_samples += len(pcm)
+            pcm_chunks.append(pcm_bytes)
+            yield pcm_bytes
+
+        if total_samples:
+            logger.info(f"Total audio length: {total_samples} samples ({total_samples/SAMPLE_RATE:.2f} seconds)")
+            # Only complete utterances reach here; a client disconnect closes the generator early
+            pcm_data = b"".join(pcm_chunks)
+            audio_cache.put(cache_key, wav_header(len(pcm_data)) + pcm_data)
         else:
             logger.warning("No audio generated")
 
@@ -167,13 +289,19 @@ async def generate_speech(request: TTSRequest):
                 detail=f"Invalid voice '{request.voice}' for language '{request.language}'. Available voices: {lang_voices}"
             )
 
+        # Preprocess text for TTS
+        processed_text = preprocess_for_tts(request.text)
+        cache_key = tts_cache_key(processed_text, request.voice, request.speed, request.language)
+        cache_status = "hit" if audio_cache.get(cache_key) is not None else "miss"
+
         # Generate streaming response
         return StreamingResponse(
-            generate_audio_stream(request.text, request.voice, request.speed, request.language),
+            generate_audio_stream(processed_text, request.voice, request.speed, request.language, cache_key),
             media_type="audio/wav",
             headers={
                 "Content-Disposition": "attachment; filename=speech.wav",
-                "Cache-Control": "no-cache"
+                "Cache-Control": "no-cache",
+                "X-TTS-Cache": cache_status
             }
         )
 
@@ -184,12 +312,35 @@ async def generate_speech(request: TTSRequest):
         raise HTTPException(status_code=500, detail=str(e))
 
 
+async def prewarm_cache():
+    """Synthesize PREWARM_PHRASES into the audio cache with the default voice"""
+    defaults = TTSRequest(text="-")
+    for phrase in PREWARM_PHRASES:
+        try:
+            processed_text = preprocess_for_tts(phrase)
+            cache_key = tts_cache_key(processed_text, defaults.voice, defaults.speed, defaults.language)
+            async for _ in generate_audio_stream(processed_text, defaults.voice, defaults.speed, defaults.language, cache_key):
+                pass
+        except Exception as e:
+            logger.warning(f"Failed to prewarm TTS cache for '{phrase[:50]}': {e}")
+
+    if PREWARM_PHRASES:
+        logger.info(f"Prewarmed TTS cache with {len(audio_cache.entries)} phrases ({audio_cache.total_bytes} bytes)")
+
+
+@app.on_event("startup")
+async def start_prewarm():
+    """Fill the audio cache in the background so startup isn't blocked on synthesis"""
+    if PREWARM_PHRASES:
+        asyncio.create_task(prewarm_cache())
+
+
 @app.get("/health")
 async def health_check():
     """Health check endpoint"""
     try:
         # Try to initialize pipeline to verify everything works
-        pipe = get_pipeline("a")
+        pipe = await get_pipeline("a")
         return {
             "status": "healthy",
             "service": "kokoro-tts",
@@ -7,123 +7,230 @@ formatting artifacts that would be spoken literally.
 
 import re
 import logging
+from functools import lru_cache
+from typing import List
+
+# The regex module ships Unicode's emoji properties; without it emoji are
+# matched by the hand-listed code point ranges below
+try:
+    import regex
+except ImportError:
+    regex = None
 
 logger = logging.getLogger(__name__)
 
+# Results of preprocess_for_tts are cached for repeated utterances (greetings,
+# acknowledgements); long texts are rarely repeated and bypass the cache
+PREPROCESS_CACHE_SIZE = 1024
+PREPROCESS_CACHE_MAX_LENGTH = 4096
+
+# Patterns are compiled once at import and shared by every TTSPreprocessor instance
+_BOLD_PATTERN = re.compile(r'\*\*([^*]+)\*\*')
+_EMPHASIS_PATTERN = re.compile(r'\*([^*]+)\*')
+_TIME_PATTERN = re.compile(r'\b(\d{1,2}):00\s*(AM|PM|am|pm)\b')
+# Pattern to match phone numbers after "Phone:" or similar identifiers
+_PHONE_PATTERN = re.compile(r'\b(Phone|Tel|Telephone|Cell|Mobile|Fax):\s*(\d{5,})\b', re.IGNORECASE)
+# Whitespace cleanup after emoji removal
+_SPACE_RUN_PATTERN = re.compile(r' {2,}')
+# Whitespace other than newlines at either end of a line
+_LINE_EDGE_WHITESPACE_PATTERN = re.compile(r'^[^\S\n]+|[^\S\n]+$', re.MULTILINE)
+# Pattern to match "e.g." abbreviation
+_EG_PATTERN = re.compile(r'\be\.g\.\s*', re.IGNORECASE)
+
+# Emoji pattern: pictographs, the symbol blocks emoji live in, and the
+# characters that combine them into a single emoji (skin tone modifiers, flag
+# letters and tags, ZWJ, variation selectors, keycap). Letters of other
+# scripts (e.g. CJK) are left alone.
+if regex is not None:
+    _EMOJI_PATTERN = regex.compile(
+        r'[\p{Extended_Pictographic}\p{Emoji_Modifier}\p{Regional_Indicator}'
+        r'\u2600-\u27bf'  # Miscellaneous symbols, dingbats
+        r'\U0001f000-\U0001faff'  # Game pieces, enclosed alphanumerics, pictographs
+        r'\u200d\u20e3\ufe00-\ufe0f\U000e0020-\U000e007f]+'
+    )
+else:
+    # Fallback - matches most common emoji ranges in Unicode
+    # This covers emoticons, symbols, pictographs, transport symbols, flags, etc.
+    # Note: the enclosed characters range also spans CJK and other scripts
+    _EMOJI_PATTERN = re.compile(
+        "["
+        "\U0001F600-\U0001F64F"  # Emoticons
+        "\U0001F300-\U0001F5FF"  # Symbols & pictographs
+        "\U0001F680-\U0001F6FF"  # Transport & map symbols
+        "\U0001F700-\U0001F77F"  # Alchemical symbols
+        "\U0001F780-\U0001F7FF"  # Geometric shapes
+        "\U0001F800-\U0001F8FF"  # Supplemental arrows
+        "\U0001F900-\U0001F9FF"  # Supplemental symbols
+        "\U0001FA00-\U0001FA6F"  # Chess symbols
+        "\U0001FA70-\U0001FAFF"  # Symbols and pictographs extended
+        "\U00002702-\U000027B0"  # Dingbats
+        "\U000024C2-\U0001F251"  # Enclosed characters
+        "\U0001F1E0-\U0001F1FF"  # Flags (iOS)
+        "\u2600-\u26FF"          # Miscellaneous symbols
+        "\u2700-\u27BF"          # Dingbats
+        "\uFE00-\uFE0F"          # Variation selectors
+        "\u200d"                 # Zero-width joiner
+        "\u2640-\u2642"          # Gender symbols
+        "]+",
+        flags=re.UNICODE
+    )
+
+_STATE_ABBREVIATIONS = {
+    'TN': 'Tennessee',
+    'AL': 'Alabama',
+    'AK': 'Alaska',
+    'AZ': 'Arizona',
+    'AR': 'Arkansas',
+    'CA': 'California',
+    'CO': 'Colorado',
+    'CT': 'Connecticut',
+    'DE': 'Delaware',
+    'FL': 'Florida',
+    'GA': 'Georgia',
+    'HI': 'Hawaii',
+    'ID': 'Idaho',
+    'IL': 'Illinois',
+    'IN': 'Indiana',
+    'IA': 'Iowa',
+    'KS': 'Kansas',
+    'KY': 'Kentucky',
+    'LA': 'Louisiana',
+    'ME': 'Maine',
+    'MD': 'Maryland',
+    'MA': 'Massachusetts',
+    'MI': 'Michigan',
+    'MN': 'Minnesota',
+    'MS': 'Mississippi',
+    'MO': 'Missouri',
+    'MT': 'Montana',
+    'NE': 'Nebraska',
+    'NV': 'Nevada',
+    'NH': 'New Hampshire',
+    'NJ': 'New Jersey',
+    'NM': 'New Mexico',
+    'NY': 'New York',
+    'NC': 'North Carolina',
+    'ND': 'North Dakota',
+    'OH': 'Ohio',
+    'OK': 'Oklahoma',
+    'OR': 'Oregon',
+    'PA': 'Pennsylvania',
+    'RI': 'Rhode Island',
+    'SC': 'South Carolina',
+    'SD': 'South Dakota',
+    'TX': 'Texas',
+    'UT': 'Utah',
+    'VT': 'Vermont',
+    'VA': 'Virginia',
+    'WA': 'Washington',
+    'WV': 'West Virginia',
+    'WI': 'Wisconsin',
+    'WY': 'Wyoming'
+}
+
+# Single alternation of the state, e.g., time and phone rules so preprocess_text
+# rewrites them in one scan. Each branch mirrors a standalone pattern;
+# the outer named group tells the dispatcher which rule matched.
+_PHONE_DIGITS = (
+    r'(?:\+?1[-.\s]?)?'  # Optional country code
+    r'(?:\()?'  # Optional opening parenthesis
+    r'(?P<{0}area>\d{{3}})'  # Area code
+    r'(?:\))?'  # Optional closing parenthesis
+    r'[-.\s]?'  # Optional separator
+    r'(?P<{0}prefix>\d{{3}})'  # First 3 digits
+    r'[-.\s]?'  # Optional separator
+    r'(?P<{0}line>\d{{4}})'  # Last 4 digits
+    r'(?=\s|$|[.,!?])'  # Followed by whitespace, end of string, or punctuation
+)
+_INLINE_PATTERN = re.compile(
+    r'(?P<state>\b(?P<state_code>[A-Z]{2})\b(?=[,.\s]|$))'
+    # "e.g." is expanded to "for example ", which puts whitespace in front of
+    # a phone number directly after it; match that number here too
+    r'|(?P<eg>(?i:\be\.g\.\s*)(?:' + _PHONE_DIGITS.format('eg_') + r')?)'
+    r'|(?P<time>\b(?P<hour>\d{1,2}):00\s*(?P<period>AM|PM|am|pm)\b)'
+    r'|(?P<labeled_phone>(?i:\b(?P<label>Phone|Tel|Telephone|Cell|Mobile|Fax):\s*(?P<label_digits>\d{5,})\b))'
+    r'|(?P<general_phone>(?:^|(?<=\s))' + _PHONE_DIGITS.format('') + r')'
+)
+_INLINE_REPLACEMENTS = {
+    'state': lambda m: _STATE_ABBREVIATIONS.get(m.group('state_code'), m.group('state_code')),
+    'eg': lambda m: 'for example ' + (
+        ' '.join(m.group('eg_area') + m.group('eg_prefix') + m.group('eg_line'))
+        if m.group('eg_area') else ''
+    ),
+    'time': lambda m: f"{m.group('hour')} {m.group('period')}",
+    'labeled_phone': lambda m: f"{m.group('label')}: {' '.join(m.group('label_digits'))}",
+    'general_phone': lambda m: ' '.join(m.group('area') + m.group('prefix') + m.group('line')),
+}
+
+# Anything one of the rules could change: non-ASCII (emoji), markdown stars,
+# digits (times, phones), two capitals (states), "e.g.", and whitespace the
+# cleanup would collapse or strip. Text without any of these is returned as is.
+_NEEDS_WORK_PATTERN = re.compile(
+    r'[^\x00-\x7f]|[*\d]|[A-Z]{2}|(?i:e\.g\.)| {2}|^[^\S\n]|[^\S\n]$',
+    re.MULTILINE
+)
+
+
+# The standalone state and general phone patterns are only used by
+# expand_abbreviations and space_phone_digits (preprocess_text goes through
+# _INLINE_PATTERN), so they are compiled on first use
+@lru_cache(maxsize=None)
+def _state_pattern():
+    # Match any two-letter uppercase word with word boundaries and optional comma/period;
+    # the replacement looks it up in state_abbreviations, which is much cheaper than
+    # a 50-way alternation tried at every position
+    return re.compile(r'\b([A-Z]{2})\b(?=[,.\s]|$)')
+
+
+@lru_cache(maxsize=None)
+def _general_phone_pattern():
+    # Pattern to match general phone number formats (with or without identifiers)
+    # Matches: (555) 556-6777, 555-556-6777, 555.556.6777, 5555566777, etc.
+    # Uses lookbehind to ensure we don't match numbers in the middle of words
+    return re.compile(
+        r'(?:^|(?<=\s))'  # Start of string or preceded by whitespace
+        r'(?:\+?1[-.\s]?)?'  # Optional country code
+        r'(?:\()?'  # Optional opening parenthesis
+        r'(\d{3})'  # Area code
+        r'(?:\))?'  # Optional closing parenthesis
+        r'[-.\s]?'  # Optional separator
+        r'(\d{3})'  # First 3 digits
+        r'[-.\s]?'  # Optional separator
+        r'(\d{4})'  # Last 4 digits
+        r'(?=\s|$|[.,!?])'  # Followed by whitespace, end of string, or punctuation
+    )
+
 
 class TTSPreprocessor:
     """
     Preprocesses text for TTS to improve speech naturalness and remove formatting.
     """
 
-    def __init__(self):
-        # Compile regex patterns for performance
-        self.bold_pattern = re.compile(r'\*\*([^*]+)\*\*')
-        self.emphasis_pattern = re.compile(r'\*([^*]+)\*')
-        self.time_pattern = re.compile(r'\b(\d{1,2}):00\s*(AM|PM|am|pm)\b')
-        # Pattern to match phone numbers after "Phone:" or similar identifiers
-        self.phone_pattern = re.compile(r'\b(Phone|Tel|Telephone|Cell|Mobile|Fax):\s*(\d{5,})\b', re.IGNORECASE)
-        # Pattern to match general phone number formats (with or without identifiers)
-        # Matches: (555) 556-6777, 555-556-6777, 555.556.6777, 5555566777, etc.
-        # Uses lookbehind to ensure we don't match numbers in the middle of words
-        self.general_phone_pattern = re.compile(
-            r'(?:^|(?<=\s))'  # Start of string or preceded by whitespace
-            r'(?:\+?1[-.\s]?)?'  # Optional country code
-            r'(?:\()?'  # Optional opening parenthesis
-            r'(\d{3})'  # Area code
-            r'(?:\))?'  # Optional closing parenthesis
-            r'[-.\s]?'  # Optional separator
-            r'(\d{3})'  # First 3 digits
-            r'[-.\s]?'  # Optional separator
-            r'(\d{4})'  # Last 4 digits
-            r'(?=\s|$|[.,!?])'  # Followed by whitespace, end of string, or punctuation
-        )
-        # Pattern to match "e.g." abbreviation
-        self.eg_pattern = re.compile(r'\be\.g\.\s*', re.IGNORECASE)
-
-        # Emoji pattern - matches most common emoji ranges in Unicode
-        # This covers emoticons, symbols, pictographs, transport symbols, flags, etc.
-        self.emoji_pattern = re.compile(
-            "["
-            "\U0001F600-\U0001F64F"  # Emoticons
-            "\U0001F300-\U0001F5FF"  # Symbols & pictographs
-            "\U0001F680-\U0001F6FF"  # Transport & map symbols
-            "\U0001F700-\U0001F77F"  # Alchemical symbols
-            "\U0001F780-\U0001F7FF"  # Geometric shapes
-            "\U0001F800-\U0001F8FF"  # Supplemental arrows
-            "\U0001F900-\U0001F9FF"  # Supplemental symbols
-            "\U0001FA00-\U0001FA6F"  # Chess symbols
-            "\U0001FA70-\U0001FAFF"  # Symbols and pictographs extended
-            "\U00002702-\U000027B0"  # Dingbats
-            "\U000024C2-\U0001F251"  # Enclosed characters
-            "\U0001F1E0-\U0001F1FF"  # Flags (iOS)
-            "\u2600-\u26FF"          # Miscellaneous symbols
-            "\u2700-\u27BF"          # Dingbats
-            "\uFE00-\uFE0F"          # Variation selectors
-            "\u200d"                 # Zero-width joiner
-            "\u2640-\u2642"          # Gender symbols
-            "]+",
-            flags=re.UNICODE
-        )
-
-        self.state_abbreviations = {
-            'TN': 'Tennessee',
-            'AL': 'Alabama',
-            'AK': 'Alaska',
-            'AZ': 'Arizona',
-            'AR': 'Arkansas',
-            'CA': 'California',
-            'CO': 'Colorado',
-            'CT': 'Connecticut',
-            'DE': 'Delaware',
-            'FL': 'Florida',
-            'GA': 'Georgia',
-            'HI': 'Hawaii',
-            'ID': 'Idaho',
-            'IL': 'Illinois',
-            'IN': 'Indiana',
-            'IA': 'Iowa',
-            'KS': 'Kansas',
-            'KY': 'Kentucky',
-            'LA': 'Louisiana',
-            'ME': 'Maine',
-            'MD': 'Maryland',
-            'MA': 'Massachusetts',
-            'MI': 'Michigan',
-            'MN': 'Minnesota',
-            'MS': 'Mississippi',
-            'MO': 'Missouri',
-            'MT': 'Montana',
-            'NE': 'Nebraska',
-            'NV': 'Nevada',
-            'NH': 'New Hampshire',
-            'NJ': 'New Jersey',
-            'NM': 'New Mexico',
-            'NY': 'New York',
-            'NC': 'North Carolina',
-            'ND': 'North Dakota',
-            'OH': 'Ohio',
-            'OK': 'Oklahoma',
-            'OR': 'Oregon',
-            'PA': 'Pennsylvania',
-            'RI': 'Rhode Island',
-            'SC': 'South Carolina',
-            'SD': 'South Dakota',
-            'TX': 'Texas',
-            'UT': 'Utah',
-            'VT': 'Vermont',
-            'VA': 'Virginia',
-            'WA': 'Washington',
-            'WV': 'West Virginia',
-            'WI': 'Wisconsin',
-            'WY': 'Wyoming'
-        }
-
-        # Create regex pattern for state abbreviations
-        # Match state abbreviations with word boundaries and optional comma/period
-        self.state_pattern = re.compile(
-            r'\b(' + '|'.join(self.state_abbreviations.keys()) + r')\b(?=[,.\s]|$)'
-        )
+    # No per-instance state: every instance shares the module-level patterns
+    __slots__ = ()
+
+    bold_pattern = _BOLD_PATTERN
+    emphasis_pattern = _EMPHASIS_PATTERN
+    time_pattern = _TIME_PATTERN
+    phone_pattern = _PHONE_PATTERN
+    space_run_pattern = _SPACE_RUN_PATTERN
+    line_edge_whitespace_pattern = _LINE_EDGE_WHITESPACE_PATTERN
+    eg_pattern = _EG_PATTERN
+    emoji_pattern = _EMOJI_PATTERN
+    state_abbreviations = _STATE_ABBREVIATIONS
+    inline_pattern = _INLINE_PATTERN
+    inline_replacements = _INLINE_REPLACEMENTS
+    needs_work_pattern = _NEEDS_WORK_PATTERN
+
+    @property
+    def state_pattern(self):
+        """Pattern for state abbreviations, compiled on first use."""
+        return _state_pattern()
+
+    @property
+    def general_phone_pattern(self):
+        """Pattern for general phone number formats, compiled on first use."""
+        return _general_phone_pattern()
 
     def remove_markdown_formatting(self, text: str) -> str:
         """
@@ -228,21 +335,14 @@ class TTSPreprocessor:
         Returns:
             Text with emojis removed
         """
-        # Remove emojis
-        text = self.emoji_pattern.sub('', text)
-
-        # Clean up any double spaces that might have been created, but preserve newlines
-        # First, clean up spaces on each line separately
-        lines = text.split('\n')
-        cleaned_lines = []
-        for line in lines:
-            # Remove multiple spaces within a line
-            line = re.sub(r' +', ' ', line)
-            # Strip leading/trailing spaces from each line
-            line = line.strip()
-            cleaned_lines.append(line)
-
-        text = '\n'.join(cleaned_lines)
+        # Remove emojis (all of which are outside ASCII, so pure-ASCII text can skip the scan)
+        if not text.isascii():
+            text = self.emoji_pattern.sub('', text)
+
+        # Clean up any double spaces that might have been created, but preserve newlines:
+        # collapse runs of spaces, then strip whitespace at the start and end of each line
+        text = self.space_run_pattern.sub(' ', text)
+        text = self.line_edge_whitespace_pattern.sub('', text)
 
         return text
 
@@ -259,6 +359,23 @@ class TTSPreprocessor:
         text = self.eg_pattern.sub('for example ', text)
         return text
 
+    def apply_inline_rules(self, text: str) -> str:
+        """
+        Expand state abbreviations and "e.g.", simplify times and space phone
+        digits in a single pass over the text.
+
+        Equivalent to expand_abbreviations, expand_eg_abbreviation,
+        simplify_times and space_phone_digits applied in that order.
+
+        Args:
+            text: Input text
+
+        Returns:
+            Text with all inline rules applied
+        """
+        replacements = self.inline_replacements
+        return self.inline_pattern.sub(lambda m: replacements[m.lastgroup](m), text)
+
     def preprocess_text(self, text: str) -> str:
         """
         Apply all preprocessing transformations to the input text.
@@ -269,7 +386,7 @@ class TTSPreprocessor:
         Returns:
             Preprocessed text ready for TTS
         """
-        if not text:
+        if not text or not self.needs_work_pattern.search(text):
             return text
 
         original_text = text
@@ -277,11 +394,9 @@ class TTSPreprocessor:
         # Apply transformations in sequence
         # Remove emojis first to avoid them interfering with other patterns
         text = self.remove_emojis(text)
+        # Markdown markers can wrap the tokens below, so strip them beforehand
         text = self.remove_markdown_formatting(text)
-        text = self.expand_abbreviations(text)
-        text = self.expand_eg_abbreviation(text)
-        text = self.simplify_times(text)
-        text = self.space_phone_digits(text)
+        text = self.apply_inline_rules(text)
 
         # Log preprocessing if text changed
         if text != original_text:
@@ -289,11 +404,38 @@ class TTSPreprocessor:
 
         return text
 
+    def preprocess_batch(self, texts: List[str]) -> List[str]:
+        """
+        Preprocess several texts, e.g. the sentences of one streamed response.
+
+        Texts are processed independently (markdown and whitespace rules must
+        not match across two texts); duplicates are processed only once.
+
+        Args:
+            texts: Raw input texts
+
+        Returns:
+            Preprocessed texts, in the same order as the input
+        """
+        processed = {}
+        results = []
+        for text in texts:
+            result = processed.get(text)
+            if result is None:
+                result = processed[text] = self.preprocess_text(text)
+            results.append(result)
+        return results
+
 
 # Create a global instance for convenience
 tts_preprocessor = TTSPreprocessor()
 
 
+@lru_cache(maxsize=PREPROCESS_CACHE_SIZE)
+def _preprocess_cached(text: str) -> str:
+    return tts_preprocessor.preprocess_text(text)
+
+
 def preprocess_for_tts(text: str) -> str:
     """
     Convenience function to preprocess text for TTS.
@@ -304,4 +446,6 @@ def preprocess_for_tts(text: str) -> str:
     Returns:
         Preprocessed text ready for TTS
     """
-    return tts_preprocessor.preprocess_text(text)
+    if len(text) > PREPROCESS_CACHE_MAX_LENGTH:
+        return tts_preprocessor.preprocess_text(text)
+    return _preprocess_cached(text)
@@ -0,0 +1,106 @@
+"""Tests for batched clip handling in the STT transcriber."""
+
+import sys
+from pathlib import Path
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+pytest.importorskip("faster_whisper")
+
+STT_DIR = Path(__file__).parent.parent / "services" / "stt_service"
+SAMPLE_RATE = 16000
+
+
+@pytest.fixture(scope="module")
+def transcriber_module():
+    # The service imports its flat config module, so load it from the service directory
+    sys.path.insert(0, str(STT_DIR))
+    try:
+        import transcriber
+        yield transcriber
+    finally:
+        sys.path.remove(str(STT_DIR))
+        for name in ("transcriber", "config"):
+            sys.modules.pop(name, None)
+
+
+class FakeBatchedPipeline:
+    """
+    Stands in for faster-whisper's BatchedInferencePipeline.
+
+    Reads clip_timestamps the way faster-whisper >= 1.2 does (seconds) and
+    "transcribes" each clip as the constant value its samples were filled with.
+    """
+
+    def __init__(self):
+        self.calls = 0
+
+    def transcribe(self, audio, clip_timestamps, **kwargs):
+        self.calls += 1
+        segments = []
+        for clip in clip_timestamps:
+            start, end = (int(clip[key] * SAMPLE_RATE) for key in ("start", "end"))
+            chunk = audio[start:end]
+            if not len(chunk):
+                continue
+            segments.append(SimpleNamespace(
+                start=round(start / SAMPLE_RATE, 3),
+                end=round(end / SAMPLE_RATE, 3),
+                text=f"clip {int(round(chunk.mean() * 10))}",
+                words=None,
+            ))
+        info = SimpleNamespace(language="en", language_probability=1.0)
+        return iter(segments), info
+
+
+def make_transcriber(transcriber_module):
+    whisper = transcriber_module.WhisperTranscriber.__new__(transcriber_module.WhisperTranscriber)
+    whisper.model_size = "test"
+    whisper.batched_model = FakeBatchedPipeline()
+    return whisper
+
+
+def make_clips(durations):
+    return [
+        np.full(int(seconds * SAMPLE_RATE), index / 10, dtype=np.float32)
+        for index, seconds in enumerate(durations)
+    ]
+
+
+def test_transcribe_batch_returns_each_clip_its_own_text(transcriber_module):
+    whisper = make_transcriber(transcriber_module)
+    clips = make_clips([1.3, 2.0, 0.7, 4.25])
+
+    results = whisper.transcribe_batch(clips, language="en", word_timestamps=False)
+
+    assert [result["text"] for result in results] == ["clip 0", "clip 1", "clip 2", "clip 3"]
+    for clip, result in zip(clips, results):
+        assert result["duration"] == pytest.approx(len(clip) / SAMPLE_RATE)
+        assert result["segments"][0]["start"] == pytest.approx(0.0)
+
+
+def test_transcribe_streaming_batches_chunks_without_mixing_text(transcriber_module):
+    whisper = make_transcriber(transcriber_module)
+    chunks = make_clips([5.0, 5.0, 3.5])
+
+    results = whisper.transcribe_streaming(chunks, language="en", word_timestamps=False)
+
+    assert whisper.batched_model.calls == 1
+    assert [result["text"] for result in results] == ["clip 0", "clip 1", "clip 2"]
+
+
+@pytest.mark.parametrize("num_samples", [0, 10, 40, 41, 16000])
+def test_gpu_mel_extractor_matches_reference_on_short_inputs(transcriber_module, num_samples):
+    pytest.importorskip("torch")
+    from faster_whisper.feature_extractor import FeatureExtractor
+
+    reference = FeatureExtractor()
+    extractor = transcriber_module.GpuMelExtractor(reference, device="cpu")
+    waveform = np.random.default_rng(0).uniform(-0.5, 0.5, num_samples).astype(np.float32)
+
+    features = extractor(waveform)
+
+    assert features.shape == reference(waveform).shape
+    np.testing.assert_allclose(features, reference(waveform), atol=1e-5)